@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import socket
+import threading
+import http.client
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import inference
+
+# A Unix socket path takes precedence over the localhost HTTP port when set
+ANALYSIS_SOCKET = os.getenv("ANALYSIS_SOCKET", "")
+ANALYSIS_HOST = os.getenv("ANALYSIS_HOST", "127.0.0.1")
+ANALYSIS_PORT = int(os.getenv("ANALYSIS_PORT", "8765"))
+MAX_TEXTS_PER_REQUEST = 1000
+CLIENT_TIMEOUT = 120
+
+# The models are not safe to call from several threads at once
+_model_lock = threading.Lock()
+_status = {'startup_seconds': None, 'warmup_seconds': None, 'requests': 0, 'texts': 0, 'busy_seconds': 0.0}
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/healthz':
+            cache = inference.result_cache()
+            self.send_json(200, dict(_status, status='ok', result_cache=cache.snapshot() if cache else None))
+        else:
+            self.send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path != '/analyze':
+            self.send_json(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            texts = json.loads(self.rfile.read(length))['texts']
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            self.send_json(400, {'error': 'Expected a JSON body like {"texts": ["..."]}'})
+            return
+        if len(texts) > MAX_TEXTS_PER_REQUEST:
+            self.send_json(400, {'error': f'At most {MAX_TEXTS_PER_REQUEST} texts per request'})
+            return
+
+        with _model_lock:
+            started = time.perf_counter()
+            results = inference.analyze_texts(texts) if texts else []
+            elapsed = time.perf_counter() - started
+            _status['requests'] += 1
+            _status['texts'] += len(texts)
+            _status['busy_seconds'] += elapsed
+        self.send_json(200, {'results': results, 'seconds': elapsed})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server():
+    if ANALYSIS_SOCKET:
+        if os.path.exists(ANALYSIS_SOCKET):
+            os.unlink(ANALYSIS_SOCKET)
+        return UnixHTTPServer(ANALYSIS_SOCKET, AnalysisHandler), ANALYSIS_SOCKET
+    return ThreadingHTTPServer((ANALYSIS_HOST, ANALYSIS_PORT), AnalysisHandler), f"http://{ANALYSIS_HOST}:{ANALYSIS_PORT}"
+
+def serve():
+    """Loads and warms up the models once, then answers analysis requests until interrupted."""
+    started = time.perf_counter()
+    inference.load_models()
+    _status['warmup_seconds'] = inference.warm_up()
+    _status['startup_seconds'] = time.perf_counter() - started
+    server, address = create_server()
+    print(f"Analysis server ready on {address} after {_status['startup_seconds']:.2f}s "
+          f"(warm-up {_status['warmup_seconds']:.2f}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if ANALYSIS_SOCKET and os.path.exists(ANALYSIS_SOCKET):
+            os.unlink(ANALYSIS_SOCKET)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=CLIENT_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class AnalysisClient:
+    """Talks to a running analysis server over one kept-alive connection."""
+
+    def __init__(self):
+        if ANALYSIS_SOCKET:
+            self.conn = UnixHTTPConnection(ANALYSIS_SOCKET)
+        else:
+            self.conn = http.client.HTTPConnection(ANALYSIS_HOST, ANALYSIS_PORT, timeout=CLIENT_TIMEOUT)
+
+    def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        data = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError(f"Analysis server returned {response.status}: {data.get('error')}")
+        return data
+
+    def health(self):
+        return self.request('GET', '/healthz')
+
+    def analyze_texts(self, texts):
+        return self.request('POST', '/analyze', {'texts': texts})['results']
+
+    def close(self):
+        self.conn.close()
+
+def connect_client():
+    """Returns an AnalysisClient if a server is listening, otherwise None."""
+    client = AnalysisClient()
+    try:
+        client.health()
+        return client
+    except (OSError, http.client.HTTPException):
+        client.close()
+        return None
+
+if __name__ == "__main__":
+    serve()
@@ -1,15 +1,441 @@
+"""Flask web application serving the demo site and its JSON API.
+
+/api/companies/<name>?interval=hour|day&days=30 returns one company's sentiment timeline, /api/movers?date=YYYY-MM-DD
+the companies whose net sentiment moved most against the previous 7 days.
+
+/api/search?q=... is ranked full-text search over brief content (GIN index) with from/to, sentiment and confidence
+filters, returning highlighted snippets and an X-Next-Cursor header for the next page.
+
+The page loads articles and summaries in one round trip from /api/dashboard, whose daily, monthly and article
+queries run concurrently on pooled connections (DASHBOARD_QUERY_THREADS).
+"""
 import os
-import psycopg2
-from datetime import datetime, timezone
-from flask import Flask, render_template, jsonify, request
+import json
+import time
+import zlib
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from flask import Flask, render_template, jsonify, request, make_response, Response, stream_with_context, g
+
+import metrics
+from db import connection, register_statement, execute_prepared, pool_stats, confidence_band_for, SEARCH_VECTOR
+from response_cache import CacheEntry, ResponseCache, start_invalidation_listener
+from event_stream import StreamHub
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
-DATABASE_URL = os.getenv("DATABASE_URL")
+response_cache = ResponseCache()
+stream_hub = StreamHub()
+
+MAX_PAGE_SIZE = 1000
+# Pages larger than this (and unbounded full-day requests) are streamed in keyset pages of STREAM_FETCH_SIZE rows
+STREAM_THRESHOLD = int(os.getenv("ARTICLES_STREAM_THRESHOLD", "200"))
+STREAM_FETCH_SIZE = 500
+# Streamed bodies larger than this are not kept in the response cache
+STREAM_CACHE_MAX_BYTES = int(os.getenv("ARTICLES_STREAM_CACHE_MAX_BYTES", str(1024 * 1024)))
+# "since" polls look back a little so briefs committed slightly out of order are not missed, clients dedup by id
+SYNC_OVERLAP = timedelta(seconds=10)
+GZIP_MIN_BYTES = 1024
+# Threads running the dashboard's queries, shared by all requests of the process. Each holds a pooled
+# connection while it runs, so keep this below DB_POOL_MAX.
+DASHBOARD_QUERY_THREADS = int(os.getenv("DASHBOARD_QUERY_THREADS", "3"))
+SEARCH_PAGE_SIZE = 20
+SENTIMENTS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL')
+# Snippets instead of full bodies keep search pages small
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=25, MinWords=10, MaxFragments=2"
+
+# Summaries read the sentiment_daily rollup, the confidence filter becomes a band filter
+# Daily Summary (for the selected day)
+register_statement("summary_daily", """
+    SELECT sentiment, SUM(brief_count) FROM sentiment_daily
+    WHERE day = %s
+    AND confidence_band >= %s
+    GROUP BY sentiment
+""")
+
+# Monthly Summary (for the month of the selected day)
+register_statement("summary_monthly", """
+    SELECT sentiment, SUM(brief_count) FROM sentiment_daily
+    WHERE sentiment IN ('POSITIVE', 'NEGATIVE')
+    AND day >= DATE_TRUNC('month', %s::date)
+    AND day < DATE_TRUNC('month', %s::date) + INTERVAL '1 month'
+    AND confidence_band >= %s
+    GROUP BY sentiment
+""")
+
+# Per-company queries read brief_companies, whose company_id() folds any spelling to the canonical ID
+register_statement("company_name", """
+    SELECT company_id, company_name FROM brief_companies
+    WHERE company_id = company_id(%s::text)
+    ORDER BY scraped_at DESC
+    LIMIT 1
+""")
+
+register_statement("company_timeline", """
+    SELECT DATE_TRUNC(%s::text, scraped_at AT TIME ZONE 'UTC') AS bucket, sentiment, COUNT(*)
+    FROM brief_companies
+    WHERE company_id = %s::text
+    AND scraped_at >= %s::timestamptz AND scraped_at < %s::timestamptz
+    AND confidence >= %s::real
+    GROUP BY bucket, sentiment
+    ORDER BY bucket
+""")
+
+# Net sentiment ((positive - negative) / mentions) of the day against the 7 days before it
+register_statement("company_movers", """
+    SELECT company_id, name, mentions, net::real / mentions AS score, baseline_mentions,
+           CASE WHEN baseline_mentions > 0 THEN baseline_net::real / baseline_mentions END AS baseline_score
+    FROM (
+        SELECT company_id, MAX(company_name) AS name,
+               COUNT(*) FILTER (WHERE scraped_at >= %s::timestamptz) AS mentions,
+               SUM(polarity) FILTER (WHERE scraped_at >= %s::timestamptz) AS net,
+               COUNT(*) FILTER (WHERE scraped_at < %s::timestamptz) AS baseline_mentions,
+               SUM(polarity) FILTER (WHERE scraped_at < %s::timestamptz) AS baseline_net
+        FROM (
+            SELECT company_id, company_name, scraped_at,
+                   CASE sentiment WHEN 'POSITIVE' THEN 1 WHEN 'NEGATIVE' THEN -1 ELSE 0 END AS polarity
+            FROM brief_companies
+            WHERE scraped_at >= %s::timestamptz - INTERVAL '7 days' AND scraped_at < %s::timestamptz
+            AND confidence >= %s::real
+        ) AS mentions
+        GROUP BY company_id
+    ) AS per_company
+    WHERE mentions >= %s::integer
+    ORDER BY ABS(net::real / mentions - COALESCE(baseline_net::real / NULLIF(baseline_mentions, 0), 0)) DESC, mentions DESC
+    LIMIT %s::integer
+""")
+
+# Change events for /api/stream are built once per process and shared by every connected client
+register_statement("stream_briefs", """
+    SELECT id, content, subject_company, sentiment, confidence, scraped_at FROM briefs
+    WHERE id = ANY(%s::integer[]) AND sentiment IS NOT NULL
+""")
+
+# Per-band counts, so each client can apply its own confidence threshold
+register_statement("stream_counts", """
+    SELECT 'daily', sentiment, confidence_band, brief_count FROM sentiment_daily
+    WHERE day = %s::date AND brief_count > 0
+    UNION ALL
+    SELECT 'monthly', sentiment, confidence_band, SUM(brief_count) FROM sentiment_daily
+    WHERE sentiment IN ('POSITIVE', 'NEGATIVE')
+    AND day >= DATE_TRUNC('month', %s::date)
+    AND day < DATE_TRUNC('month', %s::date) + INTERVAL '1 month'
+    GROUP BY sentiment, confidence_band
+    HAVING SUM(brief_count) > 0
+""")
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed bodies are still being sent here, so this is the time until the headers went out
+    endpoint = request.endpoint or 'unmatched'
+    if endpoint != 'api_stream' and 'request_started' in g:
+        metrics.observe('http_request_seconds', time.perf_counter() - g.request_started, endpoint=endpoint)
+    metrics.inc('http_requests_total', endpoint=endpoint, status=response.status_code)
+    return response
+
+dashboard_executor = ThreadPoolExecutor(DASHBOARD_QUERY_THREADS, thread_name_prefix="dashboard-query")
+
+def dumps(payload):
+    """JSON bytes, through orjson when it is installed (several times faster on large article lists)."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
+def broadcast_changes(events):
+    """Turns a batch of new_brief_channel payloads into stream events: the briefs the worker just
+    classified, and fresh counts for every day that changed. None means events may have been missed."""
+    if not len(stream_hub):
+        return
+    if events is None:
+        stream_hub.resync_all()
+        return
+    ids = [brief_id for event in events if event.get('event') == 'results' for brief_id in event.get('ids', [])]
+    days = sorted({event['day'] for event in events if 'day' in event})
+    with connection() as conn:
+        with conn.cursor() as cur:
+            if ids:
+                execute_prepared(cur, "stream_briefs", (ids,))
+                stream_hub.publish('briefs', [article_as_dict(row) for row in cur.fetchall()])
+            for day in days:
+                execute_prepared(cur, "stream_counts", (day, day, day))
+                counts = {'daily': {}, 'monthly': {}}
+                for scope, sentiment, band, count in cur.fetchall():
+                    counts[scope].setdefault(sentiment, {})[band] = int(count)
+                stream_hub.publish('counts', dict(counts, day=day))
+    for day in sorted({event['day'] for event in events if event.get('event') == 'deleted'}):
+        stream_hub.publish('deleted', {'day': day})
+
+def start_listener():
+    start_invalidation_listener(response_cache, broadcast_changes)
+
+def accepts_gzip():
+    return 'gzip' in request.headers.get('Accept-Encoding', '')
+
+def cached_response(entry, cache_status):
+    """Builds the response for a cache entry, answering 304 when the client's ETag still matches."""
+    use_gzip = accepts_gzip() and len(entry.body) >= GZIP_MIN_BYTES
+    etag = entry.etag[:-1] + '-gz"' if use_gzip else entry.etag
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = make_response('', 304)
+    else:
+        response = make_response(entry.gzipped() if use_gzip else entry.body)
+        response.mimetype = 'application/json'
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.headers.update(entry.headers)
+    response.headers['ETag'] = etag
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Cache'] = cache_status
+    return response
+
+def cached_json(key, build, headers=None):
+    """Serves `build()` as JSON through the response cache."""
+    start_listener()
+    entry = response_cache.get(key)
+    cache_status = 'HIT'
+    if entry is None:
+        generation = response_cache.generation
+        entry = response_cache.put(key, jsonify(build()).get_data(), headers, generation)
+        cache_status = 'MISS'
+    return cached_response(entry, cache_status)
+
+def utc_day_range(target_date):
+    start = datetime(target_date.year, target_date.month, target_date.day, tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+def encode_cursor(timestamp, row_id):
+    raw = f"{timestamp.isoformat()}|{row_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError for anything that is not one of our cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        timestamp, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def article_as_dict(row):
+    return {
+        'id': row[0], 'content': row[1], 'company': row[2], 'sentiment': row[3],
+        'confidence': row[4],
+        'time': row[5].strftime('%Y-%m-%d %H:%M') + ' UTC' if row[5] else 'N/A'
+    }
+
+ARTICLE_COLUMNS = "id, content, subject_company, sentiment, confidence, scraped_at"
+
+def articles_query(target_date, min_confidence, limit=None, after=None, since=None, columns=ARTICLE_COLUMNS):
+    """Builds the keyset query for one day of articles.
+
+    Pages walk (scraped_at, id) downwards starting after `after`. `since` instead returns, oldest first,
+    the briefs classified after a sync cursor so the dashboard can fetch only what changed.
+    """
+    # A plain range on scraped_at, so the index (and partition pruning) applies
+    query = f"""
+        SELECT {columns}
+        FROM briefs
+        WHERE sentiment IS NOT NULL
+        AND scraped_at >= %s AND scraped_at < %s
+        AND confidence >= %s::real
+    """
+    params = [*utc_day_range(target_date), min_confidence]
+    if since is not None:
+        query += " AND processed_at > %s ORDER BY processed_at, id"
+        params.append(since[0] - SYNC_OVERLAP)
+    else:
+        if after is not None:
+            query += " AND (scraped_at, id) < (%s, %s)"
+            params.extend(after)
+        query += " ORDER BY scraped_at DESC, id DESC"
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+def encode_search_cursor(rank, row_id):
+    raw = f"{rank!r}|{row_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_search_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        rank, row_id = raw.rsplit('|', 1)
+        return float(rank), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def search_query(text, start=None, end=None, sentiment=None, min_confidence=None, after=None, limit=SEARCH_PAGE_SIZE):
+    """Builds the ranked full-text query. Pages walk (rank, id) downwards and only the
+    returned page gets highlighted, ts_headline re-parses each body and is the expensive part."""
+    conditions = [f"{SEARCH_VECTOR} @@ websearch_to_tsquery('english', %s)", "status <> 'duplicate'"]
+    params = [text]
+    if start is not None:
+        conditions.append("scraped_at >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append("scraped_at < %s")
+        params.append(end)
+    if sentiment is not None:
+        conditions.append("sentiment = %s")
+        params.append(sentiment)
+    if min_confidence:
+        conditions.append("confidence >= %s::real")
+        params.append(min_confidence)
+
+    page_filter = ""
+    if after is not None:
+        page_filter = "WHERE (rank, id) < (%s::real, %s)"
+        params.extend(after)
+    query = f"""
+        SELECT id, ts_headline('english', content, websearch_to_tsquery('english', %s), %s),
+               subject_company, sentiment, confidence, scraped_at, rank
+        FROM (
+            SELECT * FROM (
+                SELECT id, content, subject_company, sentiment, confidence, scraped_at,
+                       ts_rank({SEARCH_VECTOR}, websearch_to_tsquery('english', %s)) AS rank
+                FROM briefs
+                WHERE {' AND '.join(conditions)}
+            ) AS matches
+            {page_filter}
+            ORDER BY rank DESC, id DESC
+            LIMIT %s
+        ) AS page
+        ORDER BY rank DESC, id DESC
+    """
+    return query, [text, HEADLINE_OPTIONS, text] + params + [limit]
+
+def fetch_rows(query, params):
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
+
+def sync_cursor():
+    """A cursor for 'everything classified from now on', taken before the articles are read."""
+    return encode_cursor(datetime.now(timezone.utc), 0)
+
+def next_page_cursor(target_date, min_confidence, after, limit):
+    """Cursor after the last row of a page, found with a cheap lookahead so it can go in the headers of a stream."""
+    query, params = articles_query(target_date, min_confidence, after=after, columns="scraped_at, id")
+    rows = fetch_rows(query + " OFFSET %s LIMIT 1", params + [limit - 1])
+    return encode_cursor(rows[0][0], rows[0][1]) if rows else None
+
+def stream_articles(target_date, min_confidence, limit, after, headers, cache_key):
+    """Streams a JSON array, gzip-compressed on the fly when the client accepts it. Rows are read in
+    keyset pages of STREAM_FETCH_SIZE on (scraped_at, id), each on its own pooled connection checkout,
+    so a slow client never holds a connection and memory stays at one page."""
+    use_gzip = accepts_gzip()
+    generation = response_cache.generation
+
+    def generate():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+        # Only bodies up to STREAM_CACHE_MAX_BYTES are kept for the response cache
+        raw_chunks = [] if cache_key is not None else None
+        cached_bytes = 0
+
+        def emit(text):
+            nonlocal raw_chunks, cached_bytes
+            data = text.encode('utf-8')
+            if raw_chunks is not None:
+                cached_bytes += len(data)
+                if cached_bytes > STREAM_CACHE_MAX_BYTES:
+                    raw_chunks = None
+                else:
+                    raw_chunks.append(data)
+            return compressor.compress(data) if compressor else data
+
+        yield emit('[')
+        key = after
+        remaining = limit
+        first = True
+        while remaining is None or remaining > 0:
+            page_size = STREAM_FETCH_SIZE if remaining is None else min(STREAM_FETCH_SIZE, remaining)
+            rows = fetch_rows(*articles_query(target_date, min_confidence, page_size, key))
+            if rows:
+                chunk = ','.join(app.json.dumps(article_as_dict(row)) for row in rows)
+                yield emit(chunk if first else ',' + chunk)
+                first = False
+            if len(rows) < page_size:
+                break
+            key = (rows[-1][5], rows[-1][0])
+            if remaining is not None:
+                remaining -= len(rows)
+        yield emit(']')
+        if compressor:
+            yield compressor.flush()
+        if raw_chunks is not None:
+            response_cache.put(cache_key, b''.join(raw_chunks), headers, generation)
+
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    response.headers.update(headers)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Cache'] = 'MISS'
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def daily_summary(cur, target_date, min_band):
+    execute_prepared(cur, "summary_daily", (target_date, min_band))
+    daily_results = dict(cur.fetchall())
+    return {
+        'positive': daily_results.get('POSITIVE', 0),
+        'negative': daily_results.get('NEGATIVE', 0),
+        'neutral': daily_results.get('NEUTRAL', 0)
+    }
+
+def monthly_summary(cur, target_date, min_band):
+    execute_prepared(cur, "summary_monthly", (target_date, target_date, min_band))
+    monthly_results = dict(cur.fetchall())
+    return {
+        'positive': monthly_results.get('POSITIVE', 0),
+        'negative': monthly_results.get('NEGATIVE', 0)
+    }
+
+def load_summary(target_date, min_confidence):
+    min_band = confidence_band_for(min_confidence)
+    with connection() as conn:
+        with conn.cursor() as cur:
+            return {
+                'daily': daily_summary(cur, target_date, min_band),
+                'monthly': monthly_summary(cur, target_date, min_band),
+            }
+
+def with_cursor(query, *args):
+    """Runs `query(cur, *args)` on its own pooled connection, for the dashboard's query threads."""
+    with connection() as conn:
+        with conn.cursor() as cur:
+            return query(cur, *args)
+
+def load_dashboard(target_date, min_confidence, since=None):
+    """Summary and articles of one day. The three queries are independent, so they run side by side
+    and the refresh costs the slowest of them rather than their sum."""
+    min_band = confidence_band_for(min_confidence)
+    query, params = articles_query(target_date, min_confidence, since=since)
+    daily = dashboard_executor.submit(with_cursor, daily_summary, target_date, min_band)
+    monthly = dashboard_executor.submit(with_cursor, monthly_summary, target_date, min_band)
+    rows = dashboard_executor.submit(fetch_rows, query, params)
+    return {
+        'summary': {'daily': daily.result(), 'monthly': monthly.result()},
+        'articles': [article_as_dict(row) for row in rows.result()],
+    }
+
 @app.route('/api/articles')
 def api_articles():
     date_str = request.args.get('date', datetime.now(timezone.utc).strftime('%Y-%m-%d'))
@@ -21,33 +447,46 @@ def api_articles():
     except (ValueError, TypeError):
         return jsonify({"error": "Invalid date or confidence format."}), 400
 
-    articles_db = []
     try:
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                query = """
-                    SELECT content, subject_company, sentiment, confidence, scraped_at
-                    FROM briefs 
-                    WHERE sentiment IS NOT NULL 
-                    AND CAST(scraped_at AT TIME ZONE 'UTC' AS DATE) = %s
-                    AND confidence >= %s
-                    ORDER BY scraped_at DESC;
-                """
-                cur.execute(query, (target_date, min_confidence))
-                articles_db = cur.fetchall()
+        limit = request.args.get('limit', type=int)
+        if limit is not None and not 0 < limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        since = decode_cursor(request.args['since']) if request.args.get('since') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query, params = articles_query(target_date, min_confidence, limit, after, since)
+    try:
+        start_listener()
+        headers = {'X-Sync-Cursor': sync_cursor()}
+        if since is not None:
+            # Incremental polls are small and unique per client, not worth caching
+            return jsonify([article_as_dict(row) for row in fetch_rows(query, params)]), 200, headers
+
+        cache_key = ('articles', target_date.isoformat(), min_confidence, limit, request.args.get('cursor'))
+        entry = response_cache.get(cache_key)
+        if entry is not None:
+            return cached_response(entry, 'HIT')
+
+        if limit is not None and limit <= STREAM_THRESHOLD:
+            generation = response_cache.generation
+            rows = fetch_rows(query, params)
+            if len(rows) == limit:
+                headers['X-Next-Cursor'] = encode_cursor(rows[-1][5], rows[-1][0])
+            body = jsonify([article_as_dict(row) for row in rows]).get_data()
+            entry = response_cache.put(cache_key, body, headers, generation)
+            return cached_response(entry, 'MISS')
+
+        if limit is not None:
+            next_cursor = next_page_cursor(target_date, min_confidence, after, limit)
+            if next_cursor:
+                headers['X-Next-Cursor'] = next_cursor
+        return stream_articles(target_date, min_confidence, limit, after, headers, cache_key)
     except Exception as e:
         print(f"Database articles query failed: {e}")
         return jsonify({"error": "Failed to retrieve articles."}), 500
 
-    articles_as_dicts = []
-    for row in articles_db:
-        articles_as_dicts.append({
-            'content': row[0], 'company': row[1], 'sentiment': row[2],
-            'confidence': row[3],
-            'time': row[4].strftime('%Y-%m-%d %H:%M') + ' UTC' if row[4] else 'N/A'
-        })
-    return jsonify(articles_as_dicts)
-
 @app.route('/api/summary')
 def api_summary():
     date_str = request.args.get('date', datetime.now(timezone.utc).strftime('%Y-%m-%d'))
@@ -59,46 +498,217 @@ def api_summary():
     except (ValueError, TypeError):
         return jsonify({"error": "Invalid date or confidence format."}), 400
 
-    summary = {}
     try:
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                # Daily Summary (for the selected day)
-                daily_query = """
-                    SELECT sentiment, COUNT(*) FROM briefs
-                    WHERE sentiment IS NOT NULL
-                    AND CAST(scraped_at AT TIME ZONE 'UTC' AS DATE) = %s
-                    AND confidence >= %s
-                    GROUP BY sentiment;
-                """
-                cur.execute(daily_query, (target_date, min_confidence))
-                daily_results = dict(cur.fetchall())
-                summary['daily'] = {
-                    'positive': daily_results.get('POSITIVE', 0),
-                    'negative': daily_results.get('NEGATIVE', 0),
-                    'neutral': daily_results.get('NEUTRAL', 0)
-                }
-
-                # Monthly Summary (for the month of the selected day)
-                monthly_query = """
-                    SELECT sentiment, COUNT(*) FROM briefs
-                    WHERE sentiment IN ('POSITIVE', 'NEGATIVE')
-                    AND scraped_at >= DATE_TRUNC('month', %s::date)
-                    AND scraped_at < DATE_TRUNC('month', %s::date) + INTERVAL '1 month'
-                    AND confidence >= %s
-                    GROUP BY sentiment;
-                """
-                cur.execute(monthly_query, (target_date, target_date, min_confidence))
-                monthly_results = dict(cur.fetchall())
-                summary['monthly'] = {
-                    'positive': monthly_results.get('POSITIVE', 0),
-                    'negative': monthly_results.get('NEGATIVE', 0)
-                }
+        return cached_json(
+            ('summary', target_date.isoformat(), min_confidence),
+            lambda: load_summary(target_date, min_confidence)
+        )
     except Exception as e:
         print(f"Database summary query failed: {e}")
         return jsonify({"error": "Failed to retrieve summary."}), 500
-        
-    return jsonify(summary)
+
+def load_company_timeline(company_id, name, interval, start, end, min_confidence):
+    with connection() as conn:
+        with conn.cursor() as cur:
+            execute_prepared(cur, "company_timeline", (interval, company_id, start, end, min_confidence))
+            buckets = {}
+            for bucket, sentiment, count in cur.fetchall():
+                counts = buckets.setdefault(bucket, {'positive': 0, 'negative': 0, 'neutral': 0})
+                counts[sentiment.lower()] = count
+    return {
+        'company_id': company_id,
+        'name': name,
+        'interval': interval,
+        'buckets': [dict(counts, time=bucket.strftime('%Y-%m-%d %H:%M') + ' UTC') for bucket, counts in buckets.items()],
+    }
+
+@app.route('/api/companies/<path:name>')
+def api_company(name):
+    interval = request.args.get('interval', 'day')
+    try:
+        days = int(request.args.get('days', '30'))
+        min_confidence = float(request.args.get('confidence', '0'))
+        if interval not in ('hour', 'day'):
+            raise ValueError
+        if not 0 < days <= 365:
+            raise ValueError
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid interval, days or confidence. Use interval=hour|day and 1 <= days <= 365."}), 400
+
+    try:
+        with connection() as conn:
+            with conn.cursor() as cur:
+                execute_prepared(cur, "company_name", (name,))
+                row = cur.fetchone()
+        if row is None:
+            return jsonify({"error": f"No classified briefs mention '{name}'."}), 404
+        company_id, display_name = row
+        # Bucket-aligned window, so the cached response stays the same within the current bucket
+        now = datetime.now(timezone.utc)
+        if interval == 'hour':
+            end = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        else:
+            end = utc_day_range(now.date())[1]
+        start = end - timedelta(days=days)
+        return cached_json(
+            ('company', company_id, interval, days, min_confidence, end.isoformat()),
+            lambda: load_company_timeline(company_id, display_name, interval, start, end, min_confidence)
+        )
+    except Exception as e:
+        print(f"Database company query failed: {e}")
+        return jsonify({"error": "Failed to retrieve company timeline."}), 500
+
+def load_movers(target_date, min_confidence, min_mentions, limit):
+    start, end = utc_day_range(target_date)
+    with connection() as conn:
+        with conn.cursor() as cur:
+            execute_prepared(cur, "company_movers", (
+                start, start, start, start, start, end, min_confidence, min_mentions, limit
+            ))
+            rows = cur.fetchall()
+    return [
+        {
+            'company_id': company_id, 'name': name, 'mentions': mentions, 'score': score,
+            'baseline_mentions': baseline_mentions, 'baseline_score': baseline_score,
+            'change': score - (baseline_score or 0.0),
+        }
+        for company_id, name, mentions, score, baseline_mentions, baseline_score in rows
+    ]
+
+@app.route('/api/movers')
+def api_movers():
+    date_str = request.args.get('date', datetime.now(timezone.utc).strftime('%Y-%m-%d'))
+    try:
+        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        min_confidence = float(request.args.get('confidence', '0'))
+        min_mentions = int(request.args.get('min_mentions', '3'))
+        limit = int(request.args.get('limit', '10'))
+        if not 0 < limit <= 100 or min_mentions < 1:
+            raise ValueError
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid date, confidence, min_mentions or limit (1-100)."}), 400
+
+    try:
+        return cached_json(
+            ('movers', target_date.isoformat(), min_confidence, min_mentions, limit),
+            lambda: load_movers(target_date, min_confidence, min_mentions, limit)
+        )
+    except Exception as e:
+        print(f"Database movers query failed: {e}")
+        return jsonify({"error": "Failed to retrieve movers."}), 500
+
+def parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+@app.route('/api/search')
+def api_search():
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({"error": "Missing search query 'q'."}), 400
+    try:
+        date_from = parse_day(request.args.get('from'))
+        date_to = parse_day(request.args.get('to'))
+        min_confidence = float(request.args.get('confidence', '0'))
+        limit = int(request.args.get('limit', str(SEARCH_PAGE_SIZE)))
+        sentiment = request.args.get('sentiment', '').upper() or None
+        if sentiment is not None and sentiment not in SENTIMENTS:
+            raise ValueError(f"sentiment must be one of {', '.join(SENTIMENTS)}")
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        after = decode_search_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid search parameters: {e}"}), 400
+
+    # Date range is inclusive on both ends, in UTC days
+    start = utc_day_range(date_from)[0] if date_from else None
+    end = utc_day_range(date_to)[1] if date_to else None
+    query, params = search_query(text, start, end, sentiment, min_confidence, after, limit)
+    try:
+        rows = fetch_rows(query, params)
+        headers = {}
+        if len(rows) == limit:
+            headers['X-Next-Cursor'] = encode_search_cursor(rows[-1][6], rows[-1][0])
+        results = [dict(article_as_dict(row), rank=row[6]) for row in rows]
+        for result in results:
+            result['snippet'] = result.pop('content')
+        return jsonify(results), 200, headers
+    except Exception as e:
+        print(f"Database search query failed: {e}")
+        return jsonify({"error": "Failed to search briefs."}), 500
+
+@app.route('/api/dashboard')
+def api_dashboard():
+    """Summary and articles of one day in one response. With `since` only briefs classified after
+    that sync cursor are returned (uncached), like /api/articles."""
+    date_str = request.args.get('date', datetime.now(timezone.utc).strftime('%Y-%m-%d'))
+    try:
+        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        min_confidence = float(request.args.get('confidence', '0'))
+        since = decode_cursor(request.args['since']) if request.args.get('since') else None
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid date, confidence or since: {e}"}), 400
+
+    try:
+        start_listener()
+        headers = {'X-Sync-Cursor': sync_cursor()}
+        if since is not None:
+            body = dumps(load_dashboard(target_date, min_confidence, since))
+            return cached_response(CacheEntry(body, 0, headers), 'BYPASS')
+
+        cache_key = ('dashboard', target_date.isoformat(), min_confidence)
+        entry = response_cache.get(cache_key)
+        if entry is not None:
+            return cached_response(entry, 'HIT')
+        generation = response_cache.generation
+        body = dumps(load_dashboard(target_date, min_confidence))
+        entry = response_cache.put(cache_key, body, headers, generation)
+        return cached_response(entry, 'MISS')
+    except Exception as e:
+        print(f"Database dashboard query failed: {e}")
+        return jsonify({"error": "Failed to retrieve dashboard."}), 500
+
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events: 'briefs' (newly classified rows), 'counts' (per-band counts of a changed day),
+    'deleted' (a day was dropped) and 'resync' (events were missed, refetch)."""
+    start_listener()
+    client = stream_hub.subscribe()
+    if client is None:
+        # The page keeps polling and retries the stream later
+        return jsonify({"error": "Too many open streams, try again later."}), 503, {'Retry-After': '30'}
+
+    def generate():
+        try:
+            yield from stream_hub.messages(client)
+        finally:
+            stream_hub.unsubscribe(client)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keeps nginx-style proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """This process's metrics in Prometheus text format. Every gunicorn worker has its own, so scrape each one
+    or add them up downstream."""
+    pool = pool_stats()
+    cache = response_cache.snapshot()
+    stream = stream_hub.snapshot()
+    gauges = [
+        ('db_pool_connections', "Pooled connections by state.", {'state': 'in_use'}, pool['in_use']),
+        ('db_pool_connections', "Pooled connections by state.", {'state': 'idle'}, pool['idle']),
+        ('db_pool_wait_seconds_avg', "Average wait for a pooled connection.", {}, pool['wait_time_avg']),
+        ('response_cache_entries', "Responses held by the response cache.", {}, cache['size']),
+        ('response_cache_hit_ratio', "Response cache hit ratio since start.", {}, cache['hit_rate']),
+        ('stream_clients', "Connected /api/stream clients.", {}, stream['clients']),
+    ]
+    return Response(metrics.render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stats')
+def api_stats():
+    return jsonify({'db_pool': pool_stats(), 'response_cache': response_cache.snapshot(), 'stream': stream_hub.snapshot()})
 
 @app.route('/healthz')
 def health_check():
@@ -0,0 +1,245 @@
+"""Checkpointed bulk analysis of unanalyzed briefs, or with --rescore MODEL_VERSION of every brief not yet
+scored by that model version. Resumes after interruption, --restart ignores the checkpoint.
+"""
+import io
+import os
+import sys
+import csv
+import json
+import time
+import multiprocessing
+from datetime import datetime, timezone
+
+import inference
+import metrics
+from db import connection, setup_database
+
+# Briefs analyzed and written per transaction; the checkpoint advances after each one
+CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", "2000"))
+BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "64"))
+NER_PROCESSES = int(os.getenv("BACKFILL_PROCESSES", str(max(1, (os.cpu_count() or 1) - 1))))
+CHECKPOINT_PATH = os.getenv("BACKFILL_CHECKPOINT", "output/backfill_checkpoint.json")
+
+
+def load_checkpoint(mode, model_version):
+    """Returns the last committed id of an interrupted run with the same mode and version, else 0."""
+    try:
+        with open(CHECKPOINT_PATH) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if checkpoint.get('mode') != mode or checkpoint.get('model_version') != model_version:
+        return 0
+    return checkpoint.get('last_id', 0)
+
+def save_checkpoint(mode, model_version, last_id, processed):
+    os.makedirs(os.path.dirname(CHECKPOINT_PATH) or '.', exist_ok=True)
+    tmp_path = CHECKPOINT_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'mode': mode, 'model_version': model_version, 'last_id': last_id, 'processed': processed,
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }, f)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+def candidate_filter(rescore_version):
+    # Briefs a worker has leased are left to it
+    if rescore_version is not None:
+        return ("model_version IS DISTINCT FROM %s AND status NOT IN ('duplicate', 'processing') AND id > %s",
+                [rescore_version])
+    return "sentiment IS NULL AND status NOT IN ('duplicate', 'processing') AND id > %s", []
+
+def iter_pages(conn, condition, params, last_id):
+    """Yields candidate (id, content) rows CHUNK_SIZE at a time, keyset-paged by id. Each page is its own
+    short transaction, so a long backfill never holds a snapshot that keeps vacuum from cleaning up."""
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT id, content FROM briefs WHERE {condition} ORDER BY id LIMIT %s;",
+                params + [last_id, CHUNK_SIZE]
+            )
+            rows = cur.fetchall()
+        conn.commit()
+        if not rows:
+            break
+        yield rows
+        last_id = rows[-1][0]
+
+# Set up once per NER worker process by init_ner
+nlp_ner = None
+
+def init_ner():
+    """Loads only the NER pipeline. The workers are spawned, so they never inherit the parent's
+    sentiment backend or the thread pools it started."""
+    global nlp_ner
+    from gazetteer import load_ner_pipeline
+    nlp_ner = load_ner_pipeline(inference.NER_MODEL_PATH)
+
+def ner_chunk(texts, nlp=None):
+    """[(companies, company_ids)] for `texts`, company_ids holding the gazetteer's canonical IDs."""
+    docs = (nlp or nlp_ner).pipe(texts, batch_size=BATCH_SIZE)
+    return [([ent.text for ent in doc.ents], [ent.kb_id_ or None for ent in doc.ents]) for doc in docs]
+
+def start_ner(pool, texts):
+    """Starts NER of `texts`, split across the pool's workers. Returns a function that waits for the results."""
+    if pool is None:
+        return lambda: ner_chunk(texts, inference.nlp_ner)
+    size = -(-len(texts) // NER_PROCESSES) or 1
+    jobs = [pool.apply_async(ner_chunk, (texts[start:start + size],)) for start in range(0, len(texts), size)]
+    return lambda: [entities for job in jobs for entities in job.get()]
+
+def iter_analyzed(pages, cache, pool):
+    """Yields (rows, results) per page with NER done and cached results filled in. The next page's
+    NER runs in the pool while the caller classifies and writes the current one."""
+    pending = None
+    for rows in pages:
+        cached = cache.get_many([content for _, content in rows]) if cache else {}
+        misses = [i for i in range(len(rows)) if i not in cached]
+        entities = start_ner(pool, [rows[i][1] for i in misses])
+        if pending:
+            yield finish_page(*pending)
+        pending = (rows, cached, misses, entities)
+    if pending:
+        yield finish_page(*pending)
+
+def finish_page(rows, cached, misses, entities):
+    results = dict(cached)
+    with metrics.timer('backfill_stage_seconds', stage='ner'):
+        found = entities()
+    for i, (companies, company_ids) in zip(misses, found):
+        results[i] = {'companies': companies, 'company_ids': company_ids}
+    return rows, [results[i] for i in range(len(rows))]
+
+def classify_chunk(texts):
+    """Sentiment for a chunk, length-sorted so every batch holds texts of similar token length."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i].split()))
+    results = [None] * len(texts)
+    try:
+        sorted_results = inference.classify_sentiment([texts[i] for i in order], BATCH_SIZE)
+        for i, result in zip(order, sorted_results):
+            results[i] = result
+    except Exception as e:
+        # One bad row must not cost the whole chunk, retry row by row and skip the failures
+        print(f"Batch failed ({e}), retrying row by row...")
+        for i in order:
+            try:
+                results[i] = inference.classify_sentiment([texts[i]], 1)[0]
+            except Exception as row_error:
+                print(f"Skipping row: {row_error}")
+    return results
+
+def write_results(conn, rows, rescore):
+    """Bulk-loads results into a temp table with COPY and applies them with a single UPDATE ... FROM."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS backfill_results (
+                id INTEGER PRIMARY KEY,
+                subject_company TEXT,
+                sentiment TEXT,
+                confidence REAL,
+                sentiment_tier TEXT,
+                model_version TEXT
+            ) ON COMMIT DELETE ROWS;
+        """)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cur.copy_expert("COPY backfill_results FROM STDIN WITH (FORMAT csv)", buffer)
+        cur.execute(f"""
+            UPDATE briefs AS b
+            SET subject_company = r.subject_company, sentiment = r.sentiment, confidence = r.confidence,
+                sentiment_tier = r.sentiment_tier, model_version = r.model_version,
+                processed_at = NOW(), status = 'done', lease_expires_at = NULL
+            FROM backfill_results AS r
+            WHERE b.id = r.id AND b.status <> 'processing' {'' if rescore else 'AND b.sentiment IS NULL'};
+        """)
+        updated = cur.rowcount
+    conn.commit()
+    return updated
+
+def backfill(rescore_version=None, restart=False):
+    """Analyzes every candidate brief (unanalyzed ones, or all not yet at `rescore_version`) in checkpointed chunks."""
+    mode = 'rescore' if rescore_version is not None else 'backfill'
+    model_version = rescore_version or inference.MODEL_VERSION
+    inference.MODEL_VERSION = model_version
+    last_id = 0 if restart else load_checkpoint(mode, model_version)
+    if last_id:
+        print(f"Resuming {mode} (model version {model_version}) after id {last_id}")
+
+    inference.load_models()
+    cache = inference.result_cache()
+    condition, params = candidate_filter(rescore_version)
+    started = time.perf_counter()
+    processed = updated = skipped = 0
+
+    with connection() as read_conn, connection() as write_conn:
+        with read_conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM briefs WHERE {condition};", params + [last_id])
+            total = cur.fetchone()[0]
+        read_conn.commit()
+        print(f"{total} brief(s) to {mode} with model version {model_version}, "
+              f"NER on {NER_PROCESSES} process(es)")
+        if not total:
+            return
+
+        pool = None
+        if NER_PROCESSES > 1:
+            pool = multiprocessing.get_context('spawn').Pool(NER_PROCESSES, initializer=init_ner)
+        try:
+            pages = iter_pages(read_conn, condition, params, last_id)
+            for rows, results in iter_analyzed(pages, cache, pool):
+                chunk = [(brief_id, content, result) for (brief_id, content), result in zip(rows, results)]
+                misses = [i for i, (_, _, result) in enumerate(chunk) if 'sentiment' not in result]
+                with metrics.timer('backfill_stage_seconds', stage='sentiment'):
+                    sentiments = classify_chunk([chunk[i][1] for i in misses])
+                analyzed_texts, analyzed = [], []
+                for i, sentiment in zip(misses, sentiments):
+                    if sentiment is not None:
+                        result = chunk[i][2]
+                        result['sentiment'], result['confidence'], result['tier'] = sentiment
+                        analyzed_texts.append(chunk[i][1])
+                        analyzed.append(result)
+                if cache and analyzed:
+                    cache.put_many(analyzed_texts, analyzed)
+
+                write_rows = [
+                    (brief_id, ', '.join(result['companies']) or None, result['sentiment'], result['confidence'],
+                     result['tier'], model_version)
+                    for brief_id, _, result in chunk
+                    if 'sentiment' in result
+                ]
+                skipped += len(chunk) - len(write_rows)
+                with metrics.timer('backfill_stage_seconds', stage='write'):
+                    updated += write_results(write_conn, write_rows, rescore_version is not None)
+                processed += len(chunk)
+                save_checkpoint(mode, model_version, chunk[-1][0], processed)
+                elapsed = time.perf_counter() - started
+                print(f"{processed}/{total} processed, {updated} updated, {skipped} skipped, "
+                      f"{len(chunk) - len(misses)} from the result cache ({processed / elapsed:.1f} docs/sec)")
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    if os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+    print(f"{mode.capitalize()} complete: {updated} brief(s) updated in {time.perf_counter() - started:.1f}s.")
+    if cache:
+        print(f"Result cache hit rate {cache.snapshot()['hit_rate']:.1%}")
+    path = metrics.write_run_summary(mode, {
+        'model_version': model_version, 'processed': processed, 'updated': updated, 'skipped': skipped,
+    })
+    print(f"Run summary written to {path}")
+
+if __name__ == "__main__":
+    if not os.getenv("DATABASE_URL"):
+        raise ValueError("DATABASE_URL environment variable is not set.")
+
+    args = sys.argv[1:]
+    rescore_version = None
+    if "--rescore" in args:
+        index = args.index("--rescore")
+        if index + 1 >= len(args):
+            raise ValueError("Usage: python backfill.py [--rescore MODEL_VERSION] [--restart]")
+        rescore_version = args[index + 1]
+    setup_database()
+    backfill(rescore_version, restart="--restart" in args)
@@ -0,0 +1,429 @@
+"""Offline benchmark suite for the hot paths, using the ~30k texts in Data/*.csv.
+
+'python benchmark.py run [clean ner fast sentiment pipeline api]' measures docs/sec and p50/p99 batch latency
+across batch sizes and thread counts, plus model load time and peak RSS. Each model suite runs in a fresh
+process. The api suite seeds synthetic briefs into the scratch database BENCH_DATABASE_URL (truncated, never
+DATABASE_URL) at each BENCH_SIZES size (10k, 100k, 300k), then measures /api/articles, /api/summary and
+/api/dashboard under 1, 4 and 16 concurrent clients, with and without the response cache. Results go to
+BENCH_DIR (output/bench/bench-*.json). 'python benchmark.py compare BASELINE.json [RESULTS.json]' lists metrics
+more than BENCH_REGRESSION_THRESHOLD (10%) worse and exits non-zero on any regression.
+"""
+import os
+import sys
+import csv
+import ast
+import json
+import time
+import random
+import hashlib
+import platform
+import resource
+import subprocess
+import http.client
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+
+BENCH_DIR = os.getenv("BENCH_DIR", "output/bench")
+# The database benchmarks truncate and reseed briefs, so they never run against DATABASE_URL
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL")
+BENCH_SIZES = [int(size) for size in os.getenv("BENCH_SIZES", "10000,100000,300000").split(",")]
+# Texts per model benchmark, sampled with a fixed seed from the ~30k texts in Data/*.csv
+BENCH_TEXTS = int(os.getenv("BENCH_TEXTS", "1000"))
+BENCH_PORT = int(os.getenv("BENCH_PORT", "5099"))
+# A metric this much worse than the baseline is reported as a regression
+REGRESSION_THRESHOLD = float(os.getenv("BENCH_REGRESSION_THRESHOLD", "0.10"))
+SEED = 0
+BATCH_SIZES = (1, 8, 32, 64)
+THREAD_COUNTS = (1, 2, 4)
+DEFAULT_BATCH_SIZE = 32
+CLIENT_COUNTS = (1, 4, 16)
+REQUESTS_PER_CLIENT = 50
+SEED_DAYS = 90
+SEED_PAGE_SIZE = 5000
+ENDPOINTS = {
+    'articles': "/api/articles?date={day}",
+    'summary': "/api/summary?date={day}",
+    'dashboard': "/api/dashboard?date={day}",
+}
+SUITES = ('clean', 'ner', 'fast', 'sentiment', 'pipeline', 'api')
+# Metric name suffixes where a larger value is better; for everything else (latency, seconds, memory) smaller is
+HIGHER_IS_BETTER = ('_per_sec',)
+
+
+def load_texts():
+    """Every text of the SEntFiN, Twitter and Kaggle sentiment corpora in Data/."""
+    sources = [
+        ("Data/SEntFiN-v1.1.csv", 'Title', {}),
+        ("Data/sent_train.csv", 'text', {}),
+        ("Data/sent_valid.csv", 'text', {}),
+        ("Data/data.csv", 'Sentence', {}),
+        ("Data/all-data.csv", 'text', {'fieldnames': ['sentiment', 'text']}),
+    ]
+    texts = []
+    for path, column, kwargs in sources:
+        if os.path.exists(path):
+            with open(path, newline='', encoding='utf-8', errors='replace') as f:
+                texts.extend(row[column] for row in csv.DictReader(f, **kwargs) if row[column])
+    return texts
+
+def load_companies(path="Data/SEntFiN-v1.1.csv"):
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        return sorted({name for row in csv.DictReader(f) for name in ast.literal_eval(row['Decisions'])})
+
+def sample_texts(texts, count=BENCH_TEXTS):
+    return random.Random(SEED).sample(texts, min(count, len(texts)))
+
+def latency_stats(latencies, prefix=''):
+    latencies = sorted(latencies)
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+    return {f'{prefix}p50_ms': percentile(50), f'{prefix}p99_ms': percentile(99)}
+
+def peak_rss_mb():
+    """Peak resident memory of this process (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def run_batches(process, texts, batch_size):
+    """docs/sec over `texts` fed to `process` batch_size at a time, with per-batch latency percentiles."""
+    latencies = []
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        batch_started = time.perf_counter()
+        process(texts[start:start + batch_size])
+        latencies.append(time.perf_counter() - batch_started)
+    return {'docs_per_sec': len(texts) / (time.perf_counter() - started), **latency_stats(latencies, 'batch_')}
+
+def run_threads(process, texts, batch_size, threads):
+    """Same as run_batches with `threads` callers sharing one model, like the analysis server's request threads."""
+    latencies = []
+    def timed(batch):
+        batch_started = time.perf_counter()
+        process(batch)
+        latencies.append(time.perf_counter() - batch_started)
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(timed, batches))
+    return {'docs_per_sec': len(texts) / (time.perf_counter() - started), **latency_stats(latencies, 'batch_')}
+
+def isolated(func, *args):
+    """Runs a benchmark in a fresh interpreter, so model load time is cold and peak RSS is its own."""
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(func, *args).result()
+
+
+def bench_clean(texts):
+    """scraper.clean_brief_text on raw anchor texts shaped like the scraped page: ticker, age, headline, source."""
+    from scraper import clean_brief_text
+
+    rng = random.Random(SEED)
+    raw = [
+        f"{rng.choice(['AAPL', 'TSLA', 'INFY', 'TCS'])}{rng.randrange(1, 59)}{rng.choice(['m', 'h'])} ago "
+        f"\"{text}\" ({rng.choice(['Reuters', 'PR Newswire', 'Business Wire'])})"
+        for text in texts
+    ]
+    return {'batch=1': run_batches(lambda batch: [clean_brief_text(text) for text in batch], raw, 1),
+            'process': {'peak_rss_mb': peak_rss_mb()}}
+
+def bench_ner(texts):
+    """nlp_ner on output/model-best (with the gazetteer of GAZETTEER_MODE) across batch sizes and caller threads."""
+    from gazetteer import load_ner_pipeline
+    from inference import NER_MODEL_PATH
+
+    started = time.perf_counter()
+    nlp = load_ner_pipeline(NER_MODEL_PATH)
+    results = {'process': {'load_seconds': time.perf_counter() - started}}
+    process = lambda batch: list(nlp.pipe(batch, batch_size=len(batch)))
+    process(texts[:DEFAULT_BATCH_SIZE])
+    for batch_size in BATCH_SIZES:
+        results[f'batch={batch_size}'] = run_batches(process, texts, batch_size)
+    for threads in THREAD_COUNTS[1:]:
+        results[f'batch={DEFAULT_BATCH_SIZE},threads={threads}'] = run_threads(process, texts, DEFAULT_BATCH_SIZE, threads)
+    results['process']['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+def bench_fast(texts):
+    """The TF-IDF + LinearSVC fast tier across batch sizes."""
+    from fast_classifier import FAST_MODEL_PATH, FastClassifier
+
+    if not os.path.exists(FAST_MODEL_PATH):
+        raise FileNotFoundError(f"{FAST_MODEL_PATH} not found, run 'python fast_classifier.py train' first.")
+    started = time.perf_counter()
+    classifier = FastClassifier(FAST_MODEL_PATH)
+    results = {'process': {'load_seconds': time.perf_counter() - started}}
+    for batch_size in BATCH_SIZES:
+        results[f'batch={batch_size}'] = run_batches(classifier.predict, texts, batch_size)
+    results['process']['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+def bench_sentiment(texts):
+    """The SENTIMENT_BACKEND transformer across batch sizes and inference thread counts (INFERENCE_THREADS)."""
+    from sentiment_backend import SENTIMENT_BACKEND, load_sentiment_backend
+
+    results = {'process': {}}
+    for threads in THREAD_COUNTS:
+        started = time.perf_counter()
+        backend = load_sentiment_backend(SENTIMENT_BACKEND, threads=threads)
+        results['process'].setdefault('load_seconds', time.perf_counter() - started)
+        process = lambda batch: backend(batch, batch_size=len(batch), truncation=True)
+        process(texts[:DEFAULT_BATCH_SIZE])
+        for batch_size in BATCH_SIZES:
+            results[f'batch={batch_size},threads={threads}'] = run_batches(process, texts, batch_size)
+    results['process']['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+def bench_pipeline(texts):
+    """inference.run_models end to end (NER, fast tier, transformer), as the worker and analysis server run it."""
+    import inference
+
+    results = {'process': {'load_seconds': inference.load_models()}}
+    results['process']['warm_up_seconds'] = inference.warm_up()
+    for batch_size in BATCH_SIZES:
+        results[f'batch={batch_size}'] = run_batches(
+            lambda batch: inference.run_models(batch, batch_size=len(batch)), texts, batch_size
+        )
+    results['process']['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def seed_row(i, texts, companies, now):
+    """The i-th synthetic brief. Each row depends only on its index, so a given size always holds the same data."""
+    rng = random.Random(SEED * 1_000_003 + i)
+    text = texts[rng.randrange(len(texts))]
+    scraped_at = now - timedelta(seconds=rng.randrange(SEED_DAYS * 86400))
+    return (
+        hashlib.sha256(f"{i}\x1f{text}".encode()).hexdigest(), text, scraped_at,
+        ', '.join(rng.sample(companies, rng.choice([0, 1, 1, 2]))) or None,
+        rng.choice(['POSITIVE', 'NEGATIVE', 'NEUTRAL']), round(rng.uniform(0.34, 1.0), 4),
+        rng.choice(['fast', 'transformer']), 'bench', 'done', scraped_at + timedelta(seconds=30),
+    )
+
+def seed_briefs(size, texts, companies):
+    """Tops the benchmark database's briefs up to `size` rows, through the triggers that keep the rollups current."""
+    from psycopg2.extras import execute_values
+    from db import connection
+    from partitions import ensure_partitions, is_partitioned
+
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM briefs;")
+            existing = cur.fetchone()[0]
+            if existing > size:
+                tables = ['briefs', 'sentiment_daily', 'brief_companies']
+                cur.execute("SELECT to_regclass('brief_hashes') IS NOT NULL;")
+                if cur.fetchone()[0]:
+                    tables.append('brief_hashes')
+                cur.execute(f"TRUNCATE {', '.join(tables)};")
+                existing = 0
+            if is_partitioned(cur):
+                ensure_partitions(cur, since=(now - timedelta(days=SEED_DAYS + 1)).date())
+            started = time.perf_counter()
+            for start in range(existing, size, SEED_PAGE_SIZE):
+                rows = [seed_row(i, texts, companies, now) for i in range(start, min(size, start + SEED_PAGE_SIZE))]
+                execute_values(cur, """
+                    INSERT INTO briefs (content_hash, content, scraped_at, subject_company, sentiment, confidence,
+                                        sentiment_tier, model_version, status, processed_at)
+                    VALUES %s ON CONFLICT DO NOTHING;
+                """, rows, page_size=SEED_PAGE_SIZE)
+                conn.commit()
+            seeded = size - existing
+            elapsed = time.perf_counter() - started
+            cur.execute("ANALYZE briefs;")
+        conn.commit()
+    print(f"Seeded {seeded} brief(s) up to {size} in {elapsed:.1f}s")
+    return {'seeded_rows_per_sec': seeded / elapsed} if seeded else {}
+
+def server_peak_rss_mb(pid):
+    """VmHWM of the server process; None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+def start_server(cache_entries):
+    """app.py on the benchmark database in its own process (threaded, like gunicorn's gthread workers).
+    The pool is sized for the largest client count unless DB_POOL_MAX is set."""
+    env = dict(os.environ, DATABASE_URL=BENCH_DATABASE_URL, RESPONSE_CACHE_MAX_ENTRIES=str(cache_entries))
+    env.setdefault('DB_POOL_MAX', str(max(CLIENT_COUNTS)))
+    server = subprocess.Popen(
+        [sys.executable, "-c", f"from app import app; app.run(host='127.0.0.1', port={BENCH_PORT}, threaded=True)"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', BENCH_PORT, timeout=5)
+            conn.request('GET', '/healthz')
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"app.py did not come up on port {BENCH_PORT}")
+
+def run_clients(path_template, clients, days):
+    """`clients` keep-alive connections issuing REQUESTS_PER_CLIENT requests each for random seeded days."""
+    def client(index):
+        rng = random.Random(SEED * 1000 + index)
+        conn = http.client.HTTPConnection('127.0.0.1', BENCH_PORT, timeout=60)
+        latencies, errors = [], 0
+        for _ in range(REQUESTS_PER_CLIENT):
+            started = time.perf_counter()
+            conn.request('GET', path_template.format(day=rng.choice(days)), headers={'Accept-Encoding': 'gzip'})
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - started)
+            errors += response.status >= 400
+        conn.close()
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        outcomes = list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for client_latencies, _ in outcomes for latency in client_latencies]
+    return {'requests_per_sec': len(latencies) / elapsed, **latency_stats(latencies),
+            'errors': sum(errors for _, errors in outcomes)}
+
+def bench_api(texts, results):
+    """Endpoint latency under 1..16 concurrent clients at every BENCH_SIZES size, with the response cache
+    disabled (every request queries Postgres) and as deployed."""
+    if not BENCH_DATABASE_URL:
+        raise ValueError("BENCH_DATABASE_URL is not set; it must point at a scratch database, briefs gets truncated.")
+    if BENCH_DATABASE_URL == os.getenv("DATABASE_URL"):
+        raise ValueError("BENCH_DATABASE_URL must not be the application's DATABASE_URL.")
+    os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+    from db import setup_database
+
+    setup_database()
+    companies = load_companies()
+    today = datetime.now(timezone.utc).date()
+    days = [(today - timedelta(days=offset)).isoformat() for offset in range(SEED_DAYS)]
+    for size in sorted(BENCH_SIZES):
+        seeded = seed_briefs(size, texts, companies)
+        if seeded:
+            results[f'db/seed/{size}'] = seeded
+        for cache_name, cache_entries in (('uncached', 0), ('cached', 512)):
+            server = start_server(cache_entries)
+            try:
+                for endpoint, path_template in ENDPOINTS.items():
+                    for clients in CLIENT_COUNTS:
+                        name = f'api/{endpoint}/{size}/{cache_name},clients={clients}'
+                        results[name] = run_clients(path_template, clients, days)
+                        print(f"{name}: {format_metrics(results[name])}")
+                results[f'api/server/{size}/{cache_name}'] = {'peak_rss_mb': server_peak_rss_mb(server.pid)}
+            finally:
+                server.terminate()
+                server.wait()
+
+
+def format_metrics(metrics):
+    return ', '.join(f"{key} {value:.3f}" if isinstance(value, float) else f"{key} {value}"
+                     for key, value in metrics.items())
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def run(suites=SUITES):
+    """Runs the selected suites and writes {'meta': ..., 'results': {benchmark: {metric: value}}} to BENCH_DIR."""
+    texts = load_texts()
+    sample = sample_texts(texts)
+    meta = {
+        'started_at': datetime.now(timezone.utc).isoformat(), 'commit': git_commit(),
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+        'texts': len(texts), 'sample': len(sample), 'sizes': BENCH_SIZES,
+        'env': {key: os.getenv(key) for key in ('SENTIMENT_BACKEND', 'GAZETTEER_MODE', 'FAST_TIER_MARGIN', 'INFERENCE_THREADS')},
+    }
+    print(f"Benchmarking {', '.join(suites)} on {len(sample)} of {len(texts)} texts ({os.cpu_count()} CPUs)")
+    results = {}
+    model_benches = {'clean': bench_clean, 'ner': bench_ner, 'fast': bench_fast,
+                     'sentiment': bench_sentiment, 'pipeline': bench_pipeline}
+    for suite in suites:
+        try:
+            if suite == 'api':
+                bench_api(texts, results)
+                continue
+            for name, metrics in isolated(model_benches[suite], texts if suite == 'clean' else sample).items():
+                results[f'{suite}/{name}'] = metrics
+                print(f"{suite}/{name}: {format_metrics(metrics)}")
+        except (ImportError, OSError, ValueError, RuntimeError, psycopg2.Error) as e:
+            results[suite] = {'skipped': str(e)}
+            print(f"{suite} skipped: {e}")
+
+    meta['finished_at'] = datetime.now(timezone.utc).isoformat()
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DIR, f"bench-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json")
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+    os.replace(path + '.tmp', path)
+    print(f"Results written to {path}")
+    return path
+
+def latest_results():
+    names = sorted(name for name in os.listdir(BENCH_DIR) if name.startswith('bench-') and name.endswith('.json'))
+    if not names:
+        raise FileNotFoundError(f"No results in {BENCH_DIR}, run 'python benchmark.py run' first.")
+    return os.path.join(BENCH_DIR, names[-1])
+
+def compare(baseline_path, current_path=None, threshold=REGRESSION_THRESHOLD):
+    """Prints every metric that moved more than `threshold` against the baseline. Returns the regressions."""
+    current_path = current_path or latest_results()
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+    print(f"Comparing {current_path} (commit {current['meta'].get('commit')}) "
+          f"with {baseline_path} (commit {baseline['meta'].get('commit')}), threshold {threshold:.0%}")
+    for key in ('cpu_count', 'env', 'sample', 'sizes'):
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            print(f"Warning: {key} differs ({baseline['meta'].get(key)} vs {current['meta'].get(key)}), "
+                  "numbers may not be comparable")
+
+    regressions, improvements, compared = [], [], 0
+    for name, metrics in current['results'].items():
+        for metric, value in metrics.items():
+            base = baseline['results'].get(name, {}).get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(base, (int, float)):
+                continue
+            compared += 1
+            if base == 0:
+                if metric == 'errors' and value > 0:
+                    regressions.append((name, metric, base, value, float('inf')))
+                continue
+            change = (value - base) / base
+            worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+            if worse > threshold:
+                regressions.append((name, metric, base, value, change))
+            elif worse < -threshold:
+                improvements.append((name, metric, base, value, change))
+
+    for title, rows in (("Regressions", regressions), ("Improvements", improvements)):
+        if rows:
+            print(f"\n{title}:")
+            for name, metric, base, value, change in rows:
+                print(f"  {name} {metric}: {base:.3f} -> {value:.3f} ({change:+.1%})")
+    print(f"\n{compared} metric(s) compared, {len(regressions)} regression(s), {len(improvements)} improvement(s)")
+    return regressions
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "run":
+        unknown = [suite for suite in sys.argv[2:] if suite not in SUITES]
+        if unknown:
+            raise ValueError(f"Unknown suite(s) {', '.join(unknown)}, expected some of {', '.join(SUITES)}.")
+        run(sys.argv[2:] or SUITES)
+    elif command == "compare" and len(sys.argv) > 2:
+        sys.exit(1 if compare(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None) else 0)
+    else:
+        print(f"Usage: python benchmark.py run [{' '.join(SUITES)}] | compare BASELINE.json [RESULTS.json]")
@@ -0,0 +1,249 @@
+"""Builds the NER training corpus (Data/train.spacy, Data/dev.spacy) from the SEntFiN Decisions column,
+replacing the loop in analysis.ipynb.
+
+One PhraseMatcher covers every entity name and titles are annotated on NER_CORPUS_PROCESSES cores. Results are
+cached per row hash in output/ner_corpus_cache.json, so after editing the CSV only changed rows are re-annotated
+and only their DocBin shards under Data/ner_corpus/ are rewritten. Rows are split into train/dev by title hash,
+so the split stays stable as rows change. --full rebuilds everything.
+"""
+import os
+import sys
+import ast
+import csv
+import json
+import time
+import hashlib
+import multiprocessing
+from collections import defaultdict
+
+import pycountry
+import spacy
+from spacy.matcher import PhraseMatcher
+from spacy.tokens import DocBin, Span
+from spacy.util import filter_spans
+
+SENTFIN_PATH = "Data/SEntFiN-v1.1.csv"
+TRAIN_PATH = "Data/train.spacy"
+DEV_PATH = "Data/dev.spacy"
+# Per-split DocBin shards; a run only rewrites the shards whose rows changed
+CORPUS_DIR = os.getenv("NER_CORPUS_DIR", "Data/ner_corpus")
+CACHE_PATH = os.getenv("NER_CORPUS_CACHE", "output/ner_corpus_cache.json")
+PROCESSES = int(os.getenv("NER_CORPUS_PROCESSES", str(max(1, (os.cpu_count() or 1) - 1))))
+BATCH_SIZE = int(os.getenv("NER_CORPUS_BATCH_SIZE", "256"))
+# Rows per task handed to a worker process
+CHUNK_SIZE = 1000
+SHARDS = 16
+DEV_FRACTION = 0.2
+# Bump when get_label/is_person change, the keyword sets are hashed on their own
+LABEL_RULES_VERSION = 1
+
+COMMODITY = {
+    "gold", "silver", "platinum", "palladium", "copper", "aluminum", "nickel",
+    "zinc", "lead", "tin", "iron ore", "steel", "cobalt", "uranium", "crude oil",
+    "oil", "brent", "wti", "gasoline", "diesel", "jet fuel", "natural gas",
+    "heating oil", "coal", "propane", "fuel oil", "wheat", "corn", "maize",
+    "soybeans", "rapeseed", "canola", "rice", "barley", "oats", "sorghum",
+    "coffee", "cocoa", "cotton", "sugar", "orange juice", "palm oil", "rubber",
+    "tea", "live cattle", "lean hogs", "milk", "lumber"
+}
+GPE = {c.name.lower() for c in pycountry.countries}
+GPE.update({"usa", "u.s.", "us", "u.k.", "uk", "europe"})
+CURRENCY = {
+    "dollar", "dollars", "euro", "euros", "yen", "yens", "yuan", "pound",
+    "pounds", "rupee", "rupees", "franc", "francs"
+}
+CONCEPT = {
+    "market", "markets", "stocks", "world stocks", "mid caps", "mid-cap funds",
+    "equity", "equities", "bonds", "futures", "options", "ipo", "ncds", "qip",
+    "gift", "experts", "investors", "promoters", "analysts", "traders",
+    "farmer bodies", "indian millers", "fii", "fiis", "nifty", "sensex", "dow jones"
+}
+KEYWORD_RULES = {"COMMODITY": COMMODITY, "GPE": GPE, "CURRENCY": CURRENCY, "CONCEPT": CONCEPT}
+RULES_HASH = hashlib.sha1(json.dumps(
+    [LABEL_RULES_VERSION, {label: sorted(words) for label, words in KEYWORD_RULES.items()}]
+).encode()).hexdigest()
+
+
+def is_person(name):
+    parts = name.strip().split()
+    if len(parts) != 2:
+        return False
+    if parts[0].isupper() and parts[1].isupper():
+        return False
+    return parts[0].istitle() and parts[1].istitle()
+
+def get_label(name):
+    """Entity label for a Decisions key, with the precedence of analysis.ipynb: commodities, then
+    two-word capitalized names as PERSON, then the other keyword sets, COMPANY as the fallback."""
+    name_lower = name.lower().strip()
+    if name_lower in COMMODITY:
+        return "COMMODITY"
+    if is_person(name):
+        return "PERSON"
+    for label in ("GPE", "CURRENCY", "CONCEPT"):
+        if name_lower in KEYWORD_RULES[label]:
+            return label
+    return "COMPANY"
+
+def row_hash(title, names):
+    """Depends only on what the annotation is made from, so editing a sentiment value changes nothing."""
+    return hashlib.sha1("\x1f".join([RULES_HASH, title, *sorted(names)]).encode()).hexdigest()
+
+def split_and_shard(title):
+    """Stable split by title hash: rows never move between train and dev as others change, and
+    repeated titles always land in the same split."""
+    value = int(hashlib.sha1(title.encode()).hexdigest()[:12], 16)
+    split = 'dev' if value % 1000 < DEV_FRACTION * 1000 else 'train'
+    return split, (value // 1000) % SHARDS
+
+def read_rows(path=SENTFIN_PATH):
+    rows, skipped = [], 0
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        for row in csv.DictReader(f):
+            try:
+                decisions = ast.literal_eval(row['Decisions'])
+            except (ValueError, SyntaxError):
+                skipped += 1
+                continue
+            names = [name for name in decisions if name.strip()]
+            title = row['Title']
+            rows.append({'title': title, 'names': names, 'hash': row_hash(title, names)})
+    if skipped:
+        print(f"Skipped {skipped} row(s) with an unparsable Decisions column")
+    return rows
+
+
+# Set up once per worker process by init_annotator
+nlp = None
+matcher = None
+pattern_keys = None
+
+def init_annotator(names):
+    """One PhraseMatcher over every Decisions key of the corpus, matched on lowercased tokens.
+    Keys with the same tokens share a pattern; each row keeps only the matches of its own keys."""
+    global nlp, matcher, pattern_keys
+    nlp = spacy.blank("en")
+    matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+    pattern_keys = {}
+    patterns = {}
+    for name in names:
+        pattern = nlp.make_doc(name.strip())
+        pattern_keys[name] = ' '.join(token.lower_ for token in pattern)
+        patterns.setdefault(pattern_keys[name], pattern)
+    for key, pattern in patterns.items():
+        matcher.add(key, [pattern])
+
+def annotate_chunk(rows):
+    """[(row hash, [(start_char, end_char, label)])], the same spans the notebook's per-entity Matcher found."""
+    results = []
+    for doc, row in nlp.pipe(((row['title'], row) for row in rows), as_tuples=True, batch_size=BATCH_SIZE):
+        labels = {pattern_keys[name]: get_label(name) for name in row['names']}
+        spans = {
+            (start, end, labels[nlp.vocab.strings[match_id]])
+            for match_id, start, end in matcher(doc) if nlp.vocab.strings[match_id] in labels
+        }
+        spans = filter_spans([Span(doc, start, end, label=label) for start, end, label in spans])
+        results.append((row['hash'], [(span.start_char, span.end_char, span.label_) for span in spans]))
+    return results
+
+def annotate(rows):
+    """{row hash: entities} for `rows` on PROCESSES cores. Workers send back plain tuples rather than
+    Docs: deserializing a Doc in the parent costs more than tokenizing the title did."""
+    names = sorted({name for row in rows for name in row['names']})
+    chunks = [rows[i:i + CHUNK_SIZE] for i in range(0, len(rows), CHUNK_SIZE)]
+    if PROCESSES == 1 or len(chunks) == 1:
+        init_annotator(names)
+        return dict(pair for chunk in chunks for pair in annotate_chunk(chunk))
+    with multiprocessing.Pool(PROCESSES, initializer=init_annotator, initargs=(names,)) as pool:
+        return dict(pair for results in pool.imap_unordered(annotate_chunk, chunks) for pair in results)
+
+def load_cache(path=CACHE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache, path=CACHE_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(cache, f)
+    os.replace(path + '.tmp', path)
+
+def shard_path(split, shard):
+    return os.path.join(CORPUS_DIR, split, f"{shard:02d}.spacy")
+
+def write_shard(tokenizer, path, shard_rows, entities):
+    doc_bin = DocBin()
+    for row in shard_rows:
+        doc = tokenizer(row['title'])
+        doc.ents = [doc.char_span(start, end, label=label) for start, end, label in entities[row['hash']]]
+        doc_bin.add(doc)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    doc_bin.to_disk(path)
+
+def merge_shards(split, output_path):
+    """Concatenates the split's shards into the single file config.cfg and gazetteer.py read."""
+    merged = DocBin()
+    for shard in range(SHARDS):
+        if os.path.exists(shard_path(split, shard)):
+            merged.merge(DocBin().from_disk(shard_path(split, shard)))
+    merged.to_disk(output_path)
+    return len(merged)
+
+def build(full=False):
+    """Rebuilds Data/train.spacy and Data/dev.spacy from SEntFiN, re-annotating only new or edited rows."""
+    started = time.perf_counter()
+    tokenizer = spacy.blank("en").tokenizer
+    rows = read_rows()
+    cache = {} if full else load_cache()
+    entities = cache.get('entities', {})
+
+    pending = {row['hash']: row for row in rows if row['hash'] not in entities}
+    if pending:
+        print(f"Annotating {len(pending)} of {len(rows)} row(s) on {PROCESSES} process(es)...")
+        entities.update(annotate(list(pending.values())))
+
+    shards = defaultdict(list)
+    for row in rows:
+        if entities[row['hash']]:
+            shards[split_and_shard(row['title'])].append(row)
+
+    # A shard is rewritten when the hashes of its rows change
+    digests = {}
+    written = defaultdict(int)
+    for split in ('train', 'dev'):
+        for shard in range(SHARDS):
+            shard_rows = shards.get((split, shard), [])
+            name = f"{split}/{shard:02d}"
+            digests[name] = hashlib.sha1("".join(row['hash'] for row in shard_rows).encode()).hexdigest()
+            if digests[name] == cache.get('shards', {}).get(name) and os.path.exists(shard_path(split, shard)):
+                continue
+            write_shard(tokenizer, shard_path(split, shard), shard_rows, entities)
+            written[split] += 1
+
+    counts = {}
+    for split, output_path in (('train', TRAIN_PATH), ('dev', DEV_PATH)):
+        if written[split] or not os.path.exists(output_path):
+            counts[split] = merge_shards(split, output_path)
+        else:
+            counts[split] = sum(len(shards.get((split, shard), [])) for shard in range(SHARDS))
+
+    # Only the current rows are kept, so the cache does not grow with every edit
+    live = {row['hash'] for row in rows}
+    save_cache({
+        'rules': RULES_HASH, 'shards': digests,
+        'entities': {key: value for key, value in entities.items() if key in live},
+    })
+    print(f"{counts['train'] + counts['dev']} annotated title(s) of {len(rows)}, "
+          f"training: {counts['train']}, dev: {counts['dev']}; {len(pending)} row(s) annotated, "
+          f"{sum(written.values())} of {2 * SHARDS} shard(s) rewritten in {time.perf_counter() - started:.1f}s")
+    if any(written.values()):
+        print("Refresh the NER label counts with: python -m spacy init labels config.cfg label_data "
+              f"--paths.train {TRAIN_PATH} --paths.dev {DEV_PATH}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] not in ("--full",):
+        print("Usage: python build_ner_corpus.py [--full]")
+    else:
+        build(full="--full" in sys.argv[1:])
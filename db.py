@@ -0,0 +1,524 @@
+import os
+import re
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+from partitions import PARTITIONING, is_partitioned, create_partitioned_table, create_hash_table, ensure_partitions
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_SSLMODE = os.getenv("DB_SSLMODE")  # e.g. "require" for managed Postgres, unset uses the URL / libpq default
+# Sized per process, so every gunicorn worker gets its own pool of at most POOL_MAX connections
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "4"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections idle for longer than this are pinged before being handed out
+HEALTH_CHECK_AFTER = float(os.getenv("DB_HEALTH_CHECK_AFTER", "30"))
+# Server-side PREPARE does not survive transaction-mode poolers such as pgbouncer, set to 0 behind one
+USE_PREPARED = os.getenv("DB_PREPARED_STATEMENTS", "1") != "0"
+# Full-text search expression; queries must repeat it exactly for the GIN index to apply
+SEARCH_VECTOR = "to_tsvector('english', content)"
+
+# name -> SQL using %s placeholders, see register_statement()
+STATEMENTS = {}
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """Bounded, thread-safe connection pool. Callers block up to POOL_TIMEOUT when it is exhausted."""
+
+    def __init__(self, minconn, maxconn, timeout):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self.stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'health_check_failures': 0,
+        }
+        for _ in range(minconn):
+            self._idle.append(self._open())
+            self._size += 1
+
+    def _open(self):
+        kwargs = {'connection_factory': PooledConnection}
+        if DB_SSLMODE:
+            kwargs['sslmode'] = DB_SSLMODE
+        conn = psycopg2.connect(DATABASE_URL, **kwargs)
+        with self._cond:
+            self.stats['connections_opened'] += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self.stats['connections_closed'] += 1
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < HEALTH_CHECK_AFTER:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._cond:
+                self.stats['health_check_failures'] += 1
+            return False
+
+    def getconn(self):
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while not self._idle and self._size >= self.maxconn:
+                waited = True
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise psycopg2.pool.PoolError(f"No connection available within {self.timeout}s")
+                self._cond.wait(remaining)
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._size += 1
+            waited_for = time.monotonic() - start
+            self.stats['checkouts'] += 1
+            if waited:
+                self.stats['waits'] += 1
+            self.stats['wait_time_total'] += waited_for
+            self.stats['wait_time_max'] = max(self.stats['wait_time_max'], waited_for)
+
+        try:
+            if conn is not None and not self._is_healthy(conn):
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._cond:
+            if discard or conn.closed:
+                self._size -= 1
+                self._close(conn)
+            else:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            for conn in self._idle:
+                self._close(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+
+    def snapshot(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.maxconn,
+            })
+        stats['wait_time_avg'] = stats['wait_time_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns this process's pool, creating it lazily so forked gunicorn workers never share sockets."""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                if not DATABASE_URL:
+                    raise Exception("DATABASE_URL environment variable not set!")
+                _pool = ConnectionPool(POOL_MIN, POOL_MAX, POOL_TIMEOUT)
+                _pool_pid = os.getpid()
+    return _pool
+
+@contextmanager
+def connection():
+    """Checks a connection out of the pool, committing on success and rolling back on error."""
+    pool = get_pool()
+    conn = pool.getconn()
+    discard = False
+    try:
+        yield conn
+        conn.commit()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        discard = True
+        raise
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, discard=discard)
+
+def connect_listener(*channels):
+    """Opens a dedicated autocommit connection (outside the pool) subscribed to the given channels."""
+    kwargs = {'sslmode': DB_SSLMODE} if DB_SSLMODE else {}
+    conn = psycopg2.connect(DATABASE_URL, **kwargs)
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with conn.cursor() as cur:
+        for channel in channels:
+            cur.execute(f"LISTEN {channel};")
+    return conn
+
+def pool_stats():
+    return get_pool().snapshot()
+
+def register_statement(name, sql):
+    """Registers a fixed query (with %s placeholders) to be prepared once per pooled connection."""
+    STATEMENTS[name] = sql
+
+def execute_prepared(cur, name, params=()):
+    """Executes a registered statement, preparing it on first use on this connection."""
+    sql = STATEMENTS[name]
+    conn = cur.connection
+    if not USE_PREPARED or not isinstance(conn, PooledConnection):
+        cur.execute(sql, params)
+        return
+    if name not in conn.prepared:
+        counter = iter(range(1, len(params) + 1))
+        cur.execute(f"PREPARE {name} AS " + re.sub(r'%s', lambda _: f"${next(counter)}", sql))
+        conn.prepared.add(name)
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))});", params)
+    else:
+        cur.execute(f"EXECUTE {name};")
+
+def setup_database():
+    """Ensures the 'briefs' table exists in the database."""
+    with connection() as conn, conn.cursor() as cur:
+        _create_schema(cur)
+    ensure_search_index()
+    print("Database setup complete. Table 'briefs' is ready.")
+
+def _create_schema(cur):
+    cur.execute("SELECT to_regclass('briefs') IS NULL;")
+    if cur.fetchone()[0] and PARTITIONING != 'none':
+        create_partitioned_table(cur)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS briefs (
+            id SERIAL PRIMARY KEY,
+            content_hash TEXT UNIQUE NOT NULL,
+            content TEXT NOT NULL,
+            scraped_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            subject_company TEXT,
+            sentiment TEXT,
+            confidence REAL,
+            processed_at TIMESTAMP WITH TIME ZONE
+        );
+    """)
+    cur.execute("ALTER TABLE briefs ADD COLUMN IF NOT EXISTS confidence REAL;")
+    # Which cascade tier produced the sentiment: 'fast' (TF-IDF + LinearSVC) or 'transformer'
+    cur.execute("ALTER TABLE briefs ADD COLUMN IF NOT EXISTS sentiment_tier TEXT;")
+    # Model version that produced the current results, so backfill.py can re-score after an update
+    cur.execute("ALTER TABLE briefs ADD COLUMN IF NOT EXISTS model_version TEXT;")
+    # Near-duplicate detection (near_dup.py): a re-published story points at its canonical brief
+    # with status 'duplicate' and is never analyzed; canonical briefs keep their MinHash signature
+    cur.execute("ALTER TABLE briefs ADD COLUMN IF NOT EXISTS duplicate_of INTEGER;")
+    cur.execute("ALTER TABLE briefs ADD COLUMN IF NOT EXISTS minhash BYTEA;")
+
+    # Work queue state used by worker.py: pending -> processing (leased) -> done / failed
+    cur.execute("""
+        SELECT NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'briefs' AND column_name = 'status'
+        );
+    """)
+    adding_status = cur.fetchone()[0]
+    cur.execute("ALTER TABLE briefs ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'pending';")
+    if adding_status:
+        # One-time migration: briefs analyzed before the queue existed must not be queued again
+        cur.execute("UPDATE briefs SET status = 'done' WHERE sentiment IS NOT NULL;")
+    cur.execute("ALTER TABLE briefs ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;")
+    cur.execute("ALTER TABLE briefs ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;")
+    # Added without a default first so existing rows are not rewritten
+    cur.execute("ALTER TABLE briefs ADD COLUMN IF NOT EXISTS queued_at TIMESTAMP WITH TIME ZONE;")
+    cur.execute("ALTER TABLE briefs ALTER COLUMN queued_at SET DEFAULT NOW();")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS briefs_queue_idx ON briefs (queued_at)
+        WHERE status IN ('pending', 'processing');
+    """)
+
+    # Keyset pagination of /api/articles walks (scraped_at, id), "since" polls walk processed_at
+    cur.execute("CREATE INDEX IF NOT EXISTS briefs_scraped_at_id_idx ON briefs (scraped_at DESC, id DESC);")
+    cur.execute("CREATE INDEX IF NOT EXISTS briefs_processed_at_idx ON briefs (processed_at);")
+
+    # NOTIFY is only a wake-up hint for the workers, the queue itself is the table. The payload names
+    # the affected day and the companies whose brief_companies rows changed, so the web app can drop
+    # just those cached responses. Payloads carry no brief IDs, so Postgres folds repeats within one
+    # transaction into a single notification.
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION notify_brief_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM pg_notify('new_brief_channel', json_build_object(
+                    'event', 'inserted', 'day', (NEW.scraped_at AT TIME ZONE 'UTC')::date,
+                    'companies', brief_company_ids(NEW.sentiment, NEW.subject_company))::text);
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('new_brief_channel', json_build_object(
+                    'event', 'deleted', 'day', (OLD.scraped_at AT TIME ZONE 'UTC')::date,
+                    'companies', brief_company_ids(OLD.sentiment, OLD.subject_company))::text);
+            ELSIF OLD.sentiment IS DISTINCT FROM NEW.sentiment
+                OR OLD.confidence IS DISTINCT FROM NEW.confidence
+                OR OLD.subject_company IS DISTINCT FROM NEW.subject_company THEN
+                PERFORM pg_notify('new_brief_channel', json_build_object(
+                    'event', 'classified', 'day', (NEW.scraped_at AT TIME ZONE 'UTC')::date,
+                    'companies', ARRAY(
+                        SELECT unnest(brief_company_ids(OLD.sentiment, OLD.subject_company))
+                        UNION SELECT unnest(brief_company_ids(NEW.sentiment, NEW.subject_company))
+                        ORDER BY 1)
+                    )::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS briefs_notify_insert ON briefs;")
+    cur.execute("DROP FUNCTION IF EXISTS notify_new_brief();")
+    cur.execute("DROP TRIGGER IF EXISTS briefs_notify_change ON briefs;")
+    cur.execute("""
+        CREATE TRIGGER briefs_notify_change
+        AFTER INSERT OR DELETE OR UPDATE OF sentiment, confidence, subject_company ON briefs
+        FOR EACH ROW EXECUTE FUNCTION notify_brief_change();
+    """)
+
+    # Per-day sentiment counts in 1% confidence bands, kept current by a trigger so that
+    # /api/summary never has to scan briefs. Every writer (worker, notebook, retention) goes through it.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sentiment_daily (
+            day DATE NOT NULL,
+            sentiment TEXT NOT NULL,
+            confidence_band SMALLINT NOT NULL,
+            brief_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, sentiment, confidence_band)
+        );
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION confidence_band(confidence REAL) RETURNS SMALLINT AS $$
+            SELECT LEAST(100, GREATEST(0, FLOOR(confidence::numeric * 100)))::smallint;
+        $$ LANGUAGE sql IMMUTABLE;
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION update_sentiment_rollup() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE'
+                AND OLD.sentiment IS NOT DISTINCT FROM NEW.sentiment
+                AND OLD.confidence IS NOT DISTINCT FROM NEW.confidence
+                AND OLD.scraped_at IS NOT DISTINCT FROM NEW.scraped_at THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.sentiment IS NOT NULL AND OLD.confidence IS NOT NULL THEN
+                UPDATE sentiment_daily SET brief_count = brief_count - 1
+                WHERE day = (OLD.scraped_at AT TIME ZONE 'UTC')::date
+                AND sentiment = OLD.sentiment
+                AND confidence_band = confidence_band(OLD.confidence);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.sentiment IS NOT NULL AND NEW.confidence IS NOT NULL THEN
+                INSERT INTO sentiment_daily (day, sentiment, confidence_band, brief_count)
+                VALUES ((NEW.scraped_at AT TIME ZONE 'UTC')::date, NEW.sentiment, confidence_band(NEW.confidence), 1)
+                ON CONFLICT (day, sentiment, confidence_band)
+                DO UPDATE SET brief_count = sentiment_daily.brief_count + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS briefs_sentiment_rollup ON briefs;")
+    cur.execute("""
+        CREATE TRIGGER briefs_sentiment_rollup
+        AFTER INSERT OR DELETE OR UPDATE OF sentiment, confidence, scraped_at ON briefs
+        FOR EACH ROW EXECUTE FUNCTION update_sentiment_rollup();
+    """)
+    cur.execute("SELECT NOT EXISTS (SELECT 1 FROM sentiment_daily);")
+    if cur.fetchone()[0]:
+        rebuild_sentiment_rollup(cur)
+
+    # One row per (brief, company) so per-company questions use an index instead of LIKE over
+    # subject_company. Kept in sync by a trigger, like sentiment_daily, so every writer fills it.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS brief_companies (
+            brief_id INTEGER NOT NULL,
+            company_id TEXT NOT NULL,
+            company_name TEXT NOT NULL,
+            scraped_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            sentiment TEXT NOT NULL,
+            confidence REAL,
+            PRIMARY KEY (brief_id, company_id)
+        );
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS brief_companies_company_idx
+        ON brief_companies (company_id, scraped_at) INCLUDE (sentiment, confidence);
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS brief_companies_scraped_at_idx ON brief_companies (scraped_at);
+    """)
+    # Same folding as gazetteer.canonical_key, so IDs match the gazetteer's canonical company IDs
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION company_id(name TEXT) RETURNS TEXT AS $$
+        DECLARE
+            words TEXT[];
+        BEGIN
+            words := array_remove(regexp_split_to_array(
+                regexp_replace(replace(lower(name), '&', ' and '), '[^\\w\\s]', ' ', 'g'), '\\s+'), '');
+            IF words[1] = 'the' THEN
+                words := words[2:];
+            END IF;
+            WHILE array_length(words, 1) > 1 AND words[array_length(words, 1)] = ANY (ARRAY[
+                'ltd', 'limited', 'inc', 'incorporated', 'corp', 'corporation', 'co', 'company', 'plc', 'llc',
+                'pvt', 'private', 'ag', 'sa', 'nv', 'se', 'group', 'holdings']) LOOP
+                words := words[1:array_length(words, 1) - 1];
+            END LOOP;
+            RETURN NULLIF(array_to_string(words, '-'), '');
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE;
+    """)
+    # The company IDs a brief has rows for in brief_companies, named in change notifications
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION brief_company_ids(sentiment TEXT, subject_company TEXT) RETURNS TEXT[] AS $$
+            SELECT COALESCE(array_agg(DISTINCT company_id(name) ORDER BY company_id(name)), '{}')
+            FROM unnest(string_to_array(subject_company, ', ')) AS name
+            WHERE sentiment IS NOT NULL AND company_id(name) IS NOT NULL;
+        $$ LANGUAGE sql IMMUTABLE;
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION sync_brief_companies() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM brief_companies WHERE brief_id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.sentiment IS NOT NULL AND NEW.subject_company IS NOT NULL THEN
+                INSERT INTO brief_companies (brief_id, company_id, company_name, scraped_at, sentiment, confidence)
+                SELECT DISTINCT ON (company_id(name)) NEW.id, company_id(name), name, NEW.scraped_at, NEW.sentiment, NEW.confidence
+                FROM unnest(string_to_array(NEW.subject_company, ', ')) AS name
+                WHERE company_id(name) IS NOT NULL;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS briefs_sync_companies ON briefs;")
+    cur.execute("""
+        CREATE TRIGGER briefs_sync_companies
+        AFTER INSERT OR DELETE OR UPDATE OF sentiment, confidence, subject_company, scraped_at ON briefs
+        FOR EACH ROW EXECUTE FUNCTION sync_brief_companies();
+    """)
+    cur.execute("SELECT NOT EXISTS (SELECT 1 FROM brief_companies);")
+    if cur.fetchone()[0]:
+        rebuild_brief_companies(cur)
+
+    if is_partitioned(cur):
+        create_hash_table(cur)
+        ensure_partitions(cur)
+    elif PARTITIONING != 'none':
+        print(f"BRIEFS_PARTITIONING={PARTITIONING} but 'briefs' is a plain table, run migrate_partitions.py to convert it.")
+
+def rebuild_sentiment_rollup(cur):
+    """Recomputes sentiment_daily from the full briefs history. Writers are blocked while it runs."""
+    cur.execute("LOCK TABLE briefs IN SHARE MODE;")
+    cur.execute("DELETE FROM sentiment_daily;")
+    cur.execute("""
+        INSERT INTO sentiment_daily (day, sentiment, confidence_band, brief_count)
+        SELECT (scraped_at AT TIME ZONE 'UTC')::date, sentiment, confidence_band(confidence), COUNT(*)
+        FROM briefs
+        WHERE sentiment IS NOT NULL AND confidence IS NOT NULL
+        GROUP BY 1, 2, 3;
+    """)
+    return cur.rowcount
+
+def ensure_search_index(cur=None):
+    """Builds the full-text index over briefs.content if it is missing or was left invalid.
+
+    An expression index rather than a stored tsvector column: adding a generated column rewrites
+    the whole table, the index does not, and Postgres keeps it current on every insert. A plain table
+    is indexed CONCURRENTLY so the scraper and workers keep writing meanwhile; partitioned tables
+    do not support that and are indexed partition by partition under a normal lock. Given `cur`, the
+    index is built inside the caller's transaction, as migrate_partitions.py does after the rebuild.
+    """
+    if cur is not None:
+        _ensure_search_index(cur)
+        return
+    with connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                _ensure_search_index(cur)
+        finally:
+            conn.autocommit = False
+
+def _ensure_search_index(cur):
+    cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('briefs_content_search_idx');")
+    row = cur.fetchone()
+    if row and row[0]:
+        return
+    # CONCURRENTLY cannot run inside a transaction block
+    concurrently = 'CONCURRENTLY' if cur.connection.autocommit and not is_partitioned(cur) else ''
+    if row:
+        print("Rebuilding invalid full-text search index...")
+        cur.execute(f"DROP INDEX {concurrently} briefs_content_search_idx;")
+    started = time.monotonic()
+    cur.execute(f"CREATE INDEX {concurrently} briefs_content_search_idx ON briefs USING GIN ({SEARCH_VECTOR});")
+    print(f"Full-text search index built in {time.monotonic() - started:.1f}s.")
+
+def rebuild_brief_companies(cur):
+    """Refills brief_companies from the classified briefs. Writers are blocked while it runs."""
+    cur.execute("LOCK TABLE briefs IN SHARE MODE;")
+    cur.execute("DELETE FROM brief_companies;")
+    cur.execute("""
+        INSERT INTO brief_companies (brief_id, company_id, company_name, scraped_at, sentiment, confidence)
+        SELECT DISTINCT ON (b.id, company_id(name)) b.id, company_id(name), name, b.scraped_at, b.sentiment, b.confidence
+        FROM briefs b, unnest(string_to_array(b.subject_company, ', ')) AS name
+        WHERE b.sentiment IS NOT NULL AND company_id(name) IS NOT NULL;
+    """)
+    return cur.rowcount
+
+def confidence_band_for(min_confidence):
+    """Lowest rollup band whose briefs all satisfy `confidence >= min_confidence` (bands are whole percents)."""
+    return max(0, min(101, math.ceil(round(min_confidence * 100, 6))))
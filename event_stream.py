@@ -0,0 +1,95 @@
+"""Fan-out hub behind /api/stream, a Server-Sent Events channel fed by the single new_brief_channel listener
+of each web process.
+
+Newly classified briefs and per-day counts are queried once and pushed to every open dashboard, which falls
+back to 30-second polling only while the stream is down. Each open stream holds a server thread, so run gunicorn
+with threaded (--worker-class gthread --threads N) or async workers. Beyond STREAM_MAX_CLIENTS open streams per
+process (50 by default) /api/stream answers 503 and the page keeps polling until its retry gets through.
+"""
+import os
+import json
+import queue
+import threading
+
+# Events a slow client may fall behind by before it is told to resync instead
+CLIENT_QUEUE_SIZE = int(os.getenv("STREAM_CLIENT_QUEUE", "100"))
+# Open streams per process; each holds a server thread, so keep this below the worker's thread count
+MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS", "50"))
+KEEPALIVE_SECONDS = 15
+# Clients reconnect after this long when the stream drops
+RETRY_MILLISECONDS = 5000
+
+
+def format_event(event, data):
+    """One Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class StreamHub:
+    """Fans events out to every connected /api/stream client of this process, one queue per client."""
+
+    def __init__(self, queue_size=CLIENT_QUEUE_SIZE, max_clients=MAX_CLIENTS):
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self._clients = set()
+        self._lock = threading.Lock()
+        self.stats = {'connected': 0, 'rejected': 0, 'sent': 0, 'resyncs': 0}
+
+    def __len__(self):
+        return len(self._clients)
+
+    def subscribe(self):
+        """Returns the new client's queue, or None when max_clients streams are already open."""
+        client = queue.Queue(self.queue_size)
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                self.stats['rejected'] += 1
+                return None
+            self._clients.add(client)
+            self.stats['connected'] += 1
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def publish(self, event, data):
+        message = format_event(event, data)
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.put_nowait(message)
+                self.stats['sent'] += 1
+            except queue.Full:
+                # Rather than block the listener on a stalled client, drop its backlog and have it refetch
+                self._reset(client)
+
+    def resync_all(self):
+        """Tells every client to refetch, e.g. after the listener reconnected and may have missed events."""
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            self._reset(client)
+
+    def _reset(self, client):
+        try:
+            while True:
+                client.get_nowait()
+        except queue.Empty:
+            pass
+        client.put_nowait(format_event('resync', {}))
+        self.stats['resyncs'] += 1
+
+    def messages(self, client):
+        """Yields the client's messages forever, with comment keep-alives so proxies keep the connection open."""
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        while True:
+            try:
+                yield client.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, clients=len(self._clients))
@@ -0,0 +1,192 @@
+"""TF-IDF + LinearSVC fast sentiment tier from analysis.ipynb, with sigmoid-calibrated probabilities.
+
+'train' serializes it to output/fast-sentiment.joblib. 'calibrate' prints the accuracy/throughput curve over
+probability-margin thresholds and stores the smallest margin within FAST_TIER_TOLERANCE of the transformer's
+accuracy with the model. The cascade stays off until then (FAST_TIER_MARGIN overrides the stored margin). Only
+texts below the margin reach DistilBERT, and briefs.sentiment_tier records which tier answered.
+"""
+import os
+import re
+import sys
+import csv
+import ast
+import math
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+FAST_MODEL_PATH = os.getenv("FAST_MODEL_PATH", "output/fast-sentiment.joblib")
+# Texts whose top-two probability gap is below this go on to the transformer. 'calibrate' chooses it and
+# stores it with the model; the cascade stays off until then. Setting FAST_TIER_MARGIN overrides it.
+FAST_TIER_MARGIN = float(os.environ["FAST_TIER_MARGIN"]) if os.getenv("FAST_TIER_MARGIN") else None
+# 'calibrate' picks the smallest margin whose accuracy is within this of the transformer alone
+FAST_TIER_TOLERANCE = float(os.getenv("FAST_TIER_TOLERANCE", "0.01"))
+LABELS = ['negative', 'positive', 'neutral']
+LABEL_IDS = {label: i for i, label in enumerate(LABELS)}
+CALIBRATION_MARGINS = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, float('inf')]
+
+
+def clean_text(text):
+    """Same normalization the SVM was trained with in analysis.ipynb."""
+    text = text.lower() # To lowercase
+    # Remove any impurities of text
+    text = re.sub(r'https?://\S+|www\.\S+', '', text)
+    text = re.sub(r'\$\w*', '', text)
+    text = re.sub(r'<.*?>', '', text)
+    text = re.sub(r'[^a-z\s]', '', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+def read_csv_rows(path, **kwargs):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        return list(csv.DictReader(f, **kwargs))
+
+def load_training_corpus():
+    """The combined corpora of analysis.ipynb as (texts, label ids). Data/sent_valid.csv is held out for calibration."""
+    pairs = []
+    for row in read_csv_rows('Data/SEntFiN-v1.1.csv'):
+        decisions = ast.literal_eval(row['Decisions'])
+        if decisions:
+            pairs.append((row['Title'], list(decisions.values())[0]))
+    for row in read_csv_rows('Data/sent_train.csv'):
+        pairs.append((row['text'], LABELS[int(row['label'])]))
+    for row in read_csv_rows('Data/data.csv'):
+        pairs.append((row['Sentence'], row['Sentiment']))
+    for row in read_csv_rows('Data/all-data.csv', fieldnames=['sentiment', 'text']):
+        pairs.append((row['text'], row['sentiment']))
+
+    texts, targets = [], []
+    for text, label in pairs:
+        if text and label in LABEL_IDS:
+            texts.append(clean_text(text))
+            targets.append(LABEL_IDS[label])
+    return texts, targets
+
+def train(path=FAST_MODEL_PATH):
+    """Fits final_svm_pipeline from analysis.ipynb on the combined corpora and serializes it. The SVM
+    is wrapped in a sigmoid calibration, so its probabilities can fill the confidence column."""
+    import joblib
+    from sklearn.pipeline import Pipeline
+    from sklearn.svm import LinearSVC
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    texts, targets = load_training_corpus()
+    print(f"Training on {len(texts)} samples...")
+    pipeline = Pipeline([
+        ('tfidf', TfidfVectorizer(max_features=5000, ngram_range=(1, 2), stop_words='english')),
+        ('classifier', CalibratedClassifierCV(LinearSVC(random_state=42, C=1.0, max_iter=2000), method='sigmoid', cv=5))
+    ])
+    pipeline.fit(texts, targets)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    joblib.dump({'pipeline': pipeline, 'labels': LABELS, 'trained_at': datetime.now(timezone.utc).isoformat()}, path)
+    print(f"Fast classifier saved to {path}")
+
+
+class FastClassifier:
+    def __init__(self, path=FAST_MODEL_PATH):
+        import joblib
+
+        bundle = joblib.load(path)
+        self.pipeline = bundle['pipeline']
+        self.labels = bundle['labels']
+        if not hasattr(self.pipeline, 'predict_proba'):
+            raise ValueError(f"{path} holds an uncalibrated model, run 'python fast_classifier.py train' again")
+        self.margin = FAST_TIER_MARGIN if FAST_TIER_MARGIN is not None else bundle.get('margin')
+
+    def predict(self, texts):
+        """Returns [(label, margin, score)]. score is the calibrated probability of the label, so it can
+        fill the same confidence column as the transformer, margin its gap to the runner-up."""
+        probabilities = self.pipeline.predict_proba([clean_text(text) for text in texts])
+        top_two = np.sort(probabilities, axis=1)[:, -2:]
+        margins = top_two[:, 1] - top_two[:, 0]
+        best = probabilities.argmax(axis=1)
+        return [
+            (self.labels[label_id].upper(), float(margin), float(probabilities[i, label_id]))
+            for i, (label_id, margin) in enumerate(zip(best, margins))
+        ]
+
+def load_fast_classifier(path=FAST_MODEL_PATH):
+    """Returns the serialized fast tier, or None if it has not been trained and calibrated (everything
+    goes to the transformer)."""
+    if not os.path.exists(path):
+        return None
+    try:
+        classifier = FastClassifier(path)
+    except ValueError as e:
+        print(f"Fast tier disabled: {e}")
+        return None
+    if classifier.margin is None:
+        print("Fast tier disabled: no margin chosen yet, run 'python fast_classifier.py calibrate'")
+        return None
+    if math.isinf(classifier.margin):
+        # It would run on every text and never answer one
+        print("Fast tier disabled: calibration found no margin accurate enough")
+        return None
+    return classifier
+
+def save_margin(margin, path=FAST_MODEL_PATH):
+    import joblib
+
+    bundle = joblib.load(path)
+    bundle['margin'] = margin
+    bundle['calibrated_at'] = datetime.now(timezone.utc).isoformat()
+    joblib.dump(bundle, path)
+
+def calibrate(data_path="Data/sent_valid.csv", margins=CALIBRATION_MARGINS, batch_size=32):
+    """Prints accuracy, transformer share and throughput of the cascade at each margin threshold, then
+    stores the smallest margin within FAST_TIER_TOLERANCE of the transformer's accuracy with the model."""
+    from sentiment_backend import SENTIMENT_BACKEND, load_sentiment_backend, load_labeled_texts
+
+    rows = load_labeled_texts(data_path)
+    texts = [text for text, _ in rows]
+    expected = [label for _, label in rows]
+    fast = FastClassifier()
+    transformer = load_sentiment_backend()
+
+    started = time.perf_counter()
+    fast_results = fast.predict(texts)
+    fast_seconds = time.perf_counter() - started
+    transformer(texts[:batch_size], batch_size=batch_size)  # warm-up
+    started = time.perf_counter()
+    transformer_labels = [result['label'].upper() for result in transformer(texts, batch_size=batch_size)]
+    transformer_per_text = (time.perf_counter() - started) / len(texts)
+
+    print(f"Calibration on {len(texts)} texts from {data_path}, transformer backend {SENTIMENT_BACKEND}")
+    print("Margin 0 is the fast tier alone, inf the transformer alone.")
+    print(f"{'margin':>8} {'accuracy':>9} {'to transformer':>15} {'texts/s':>9}")
+    transformer_accuracy = sum(label == truth for label, truth in zip(transformer_labels, expected)) / len(texts)
+    chosen = None
+    for margin in margins:
+        routed = 0
+        correct = 0
+        for (fast_label, fast_margin, _), transformer_label, truth in zip(fast_results, transformer_labels, expected):
+            if fast_margin < margin:
+                routed += 1
+                correct += transformer_label == truth
+            else:
+                correct += fast_label == truth
+        # The fast tier always runs, the transformer only on routed texts
+        seconds = fast_seconds + routed * transformer_per_text
+        print(f"{margin:>8} {correct / len(texts):>9.4f} {routed / len(texts):>14.1%} {len(texts) / seconds:>9.1f}")
+        if chosen is None and correct / len(texts) >= transformer_accuracy - FAST_TIER_TOLERANCE:
+            chosen = margin
+
+    save_margin(chosen)
+    if math.isinf(chosen):
+        print(f"No margin is within {FAST_TIER_TOLERANCE} of the transformer alone, the cascade stays off")
+    else:
+        print(f"Chose margin {chosen} (accuracy within {FAST_TIER_TOLERANCE} of the transformer alone), "
+              f"saved to {FAST_MODEL_PATH}")
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "train":
+        train()
+    elif command == "calibrate":
+        calibrate(sys.argv[2] if len(sys.argv) > 2 else "Data/sent_valid.csv")
+    else:
+        print("Usage: python fast_classifier.py train | calibrate [csv_path]")
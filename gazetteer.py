@@ -0,0 +1,203 @@
+"""Company gazetteer compiled from Data/train.spacy annotations and the SEntFiN Decisions column into a single
+PhraseMatcher. Aliases map to canonical company IDs.
+
+GAZETTEER_MODE=post links and extends the NER model's entities, only extracts with the gazetteer alone.
+'python gazetteer.py build' writes output/gazetteer.json, and 'eval' reports precision/recall and docs/sec on
+Data/dev.spacy. The result cache picks up a rebuilt file on its own; stored briefs keep their companies until
+they are re-scored with 'python backfill.py --rescore'.
+"""
+import os
+import re
+import sys
+import ast
+import csv
+import json
+import time
+from collections import Counter, defaultdict
+
+import spacy
+from spacy.language import Language
+from spacy.matcher import PhraseMatcher
+from spacy.tokens import DocBin, Span
+from spacy.util import filter_spans
+
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", "output/gazetteer.json")
+# "post" links the NER model's entities to canonical IDs and adds missed gazetteer matches,
+# "only" skips the NER model and extracts with the gazetteer alone, "off" disables it
+GAZETTEER_MODE = os.getenv("GAZETTEER_MODE", "post")
+MIN_ALIAS_LENGTH = 2
+LEGAL_SUFFIXES = {
+    "ltd", "limited", "inc", "incorporated", "corp", "corporation", "co", "company", "plc", "llc",
+    "pvt", "private", "ag", "sa", "nv", "se", "group", "holdings",
+}
+NON_WORD = re.compile(r"[^\w\s]")
+
+
+def canonical_key(name):
+    """Folds case, punctuation and legal suffixes, so 'Tata Motors Ltd.' and 'TATA MOTORS' share a key."""
+    words = NON_WORD.sub(' ', name.lower().replace('&', ' and ')).split()
+    if words and words[0] == 'the':
+        words = words[1:]
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return ' '.join(words)
+
+def canonical_id(name):
+    return canonical_key(name).replace(' ', '-')
+
+def read_training_aliases(train_path="Data/train.spacy", sentfin_path="Data/SEntFiN-v1.1.csv", exclude_texts=()):
+    """Counts (alias, label) from the annotated training docs and the SEntFiN Decisions keys.
+    Decisions keys never seen annotated fall back to COMPANY, like get_label in analysis.ipynb."""
+    exclude_texts = set(exclude_texts)
+    labels = defaultdict(Counter)
+    if os.path.exists(train_path):
+        nlp = spacy.blank("en")
+        for doc in DocBin().from_disk(train_path).get_docs(nlp.vocab):
+            for ent in doc.ents:
+                labels[ent.text.strip()][ent.label_] += 1
+    if os.path.exists(sentfin_path):
+        with open(sentfin_path, newline='', encoding='utf-8', errors='replace') as f:
+            for row in csv.DictReader(f):
+                if row['Title'] in exclude_texts:
+                    continue
+                for name in ast.literal_eval(row['Decisions']):
+                    name = name.strip()
+                    if name not in labels:
+                        labels[name]['COMPANY'] += 1
+    return labels
+
+def build(path=GAZETTEER_PATH, exclude_texts=()):
+    """Groups every alias under its canonical ID, with the most frequent spelling as the display name."""
+    entities = {}
+    for alias, label_counts in read_training_aliases(exclude_texts=exclude_texts).items():
+        entity_id = canonical_id(alias)
+        if len(alias) < MIN_ALIAS_LENGTH or not entity_id:
+            continue
+        entity = entities.setdefault(entity_id, {'aliases': Counter(), 'labels': Counter()})
+        entity['aliases'][alias] += sum(label_counts.values())
+        entity['labels'].update(label_counts)
+
+    gazetteer = {
+        entity_id: {
+            'name': entity['aliases'].most_common(1)[0][0],
+            'label': entity['labels'].most_common(1)[0][0],
+            'aliases': sorted(entity['aliases']),
+        }
+        for entity_id, entity in sorted(entities.items())
+    }
+    if path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'entities': gazetteer}, f, ensure_ascii=False, indent=1)
+        print(f"Gazetteer with {len(gazetteer)} entities and "
+              f"{sum(len(e['aliases']) for e in gazetteer.values())} aliases saved to {path}")
+    return gazetteer
+
+
+class CompanyGazetteer:
+    """Single-pass PhraseMatcher over every alias. Matches carry the canonical ID as kb_id.
+
+    In "post" mode model entities keep their spans and only get linked, gazetteer matches
+    fill in where the model found nothing. With overwrite_ents the gazetteer alone decides.
+    """
+
+    def __init__(self, nlp, name, path, overwrite_ents):
+        with open(path, encoding='utf-8') as f:
+            self.entities = json.load(f)['entities']
+        self.overwrite_ents = overwrite_ents
+        self.matcher = PhraseMatcher(nlp.vocab, attr="ORTH")
+        self.alias_ids = {}
+        for entity_id, entity in self.entities.items():
+            self.matcher.add(entity_id, list(nlp.tokenizer.pipe(entity['aliases'])))
+            for alias in entity['aliases']:
+                self.alias_ids[canonical_key(alias)] = entity_id
+
+    def lookup(self, text):
+        """Canonical ID for any spelling of a known entity, or None."""
+        return self.alias_ids.get(canonical_key(text))
+
+    def __call__(self, doc):
+        matches = [
+            Span(doc, start, end, label=self.entities[doc.vocab.strings[match_id]]['label'],
+                 kb_id=doc.vocab.strings[match_id])
+            for match_id, start, end in self.matcher(doc)
+        ]
+        if self.overwrite_ents:
+            doc.ents = filter_spans(matches)
+            return doc
+
+        linked = []
+        taken = set()
+        for ent in doc.ents:
+            entity_id = self.lookup(ent.text)
+            linked.append(Span(doc, ent.start, ent.end, label=ent.label_, kb_id=entity_id or ''))
+            taken.update(range(ent.start, ent.end))
+        extra = [span for span in filter_spans(matches) if not taken.intersection(range(span.start, span.end))]
+        doc.ents = sorted(linked + extra, key=lambda span: span.start)
+        return doc
+
+
+@Language.factory("company_gazetteer", default_config={"path": GAZETTEER_PATH, "overwrite_ents": False})
+def create_company_gazetteer(nlp, name, path, overwrite_ents):
+    return CompanyGazetteer(nlp, name, path, overwrite_ents)
+
+def load_ner_pipeline(model_path, mode=GAZETTEER_MODE, path=GAZETTEER_PATH):
+    """The NER pipeline for `mode`. Without a built gazetteer file it is the plain NER model."""
+    if mode == 'off' or not os.path.exists(path):
+        return spacy.load(model_path)
+    if mode == 'only':
+        nlp = spacy.blank("en")
+        nlp.add_pipe("company_gazetteer", config={"path": path, "overwrite_ents": True})
+        return nlp
+    if mode == 'post':
+        nlp = spacy.load(model_path)
+        nlp.add_pipe("company_gazetteer", config={"path": path, "overwrite_ents": False}, last=True)
+        return nlp
+    raise ValueError(f"Unknown GAZETTEER_MODE '{mode}', expected post, only or off.")
+
+def evaluate(nlp, docs, batch_size=256):
+    """Exact-span precision/recall/F1 of `nlp` against the gold docs, plus docs/sec."""
+    texts = [doc.text for doc in docs]
+    started = time.perf_counter()
+    predicted = list(nlp.pipe(texts, batch_size=batch_size))
+    elapsed = time.perf_counter() - started
+    true_positives = gold_total = predicted_total = 0
+    for gold, prediction in zip(docs, predicted):
+        gold_spans = {(ent.start_char, ent.end_char, ent.label_) for ent in gold.ents}
+        predicted_spans = {(ent.start_char, ent.end_char, ent.label_) for ent in prediction.ents}
+        true_positives += len(gold_spans & predicted_spans)
+        gold_total += len(gold_spans)
+        predicted_total += len(predicted_spans)
+    precision = true_positives / predicted_total if predicted_total else 0.0
+    recall = true_positives / gold_total if gold_total else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1, len(texts) / elapsed
+
+def evaluate_all(dev_path="Data/dev.spacy", model_path="output/model-best"):
+    """Compares gazetteer-only, NER model and NER + gazetteer post-pass on the dev set.
+
+    The gazetteer is rebuilt without the dev titles' SEntFiN decisions, otherwise it would contain the answers.
+    """
+    docs = list(DocBin().from_disk(dev_path).get_docs(spacy.blank("en").vocab))
+    eval_path = os.path.join(os.path.dirname(GAZETTEER_PATH) or '.', "gazetteer.eval.json")
+    build(eval_path, exclude_texts={doc.text for doc in docs})
+    print(f"Evaluating on {len(docs)} docs from {dev_path}")
+    print(f"{'mode':8} {'precision':>9} {'recall':>7} {'f1':>7} {'docs/s':>9}")
+    for mode in ['only', 'off', 'post']:
+        try:
+            nlp = load_ner_pipeline(model_path, mode, eval_path)
+        except (OSError, ValueError) as e:
+            print(f"{mode:8} skipped: {e}")
+            continue
+        precision, recall, f1, rate = evaluate(nlp, docs)
+        print(f"{mode:8} {precision:>9.4f} {recall:>7.4f} {f1:>7.4f} {rate:>9.1f}")
+    os.remove(eval_path)
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "build":
+        build()
+    elif command == "eval":
+        evaluate_all()
+    else:
+        print("Usage: python gazetteer.py build | eval")
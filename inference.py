@@ -0,0 +1,153 @@
+import os
+import time
+import hashlib
+import threading
+
+import metrics
+from sentiment_backend import (SENTIMENT_BACKEND, SENTIMENT_MODEL_NAME, ONNX_MODEL_DIR, ONNX_FILES,
+                               load_sentiment_backend)
+from fast_classifier import FAST_MODEL_PATH, load_fast_classifier
+from result_cache import get_result_cache
+
+NER_MODEL_PATH = "output/model-best"
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", "32"))
+# Recorded with every result; bump it when a model changes and re-score with 'python backfill.py --rescore'.
+# The result cache additionally keys on the model files themselves, see cache_version()
+MODEL_VERSION = os.getenv("MODEL_VERSION", "1")
+WARMUP_TEXTS = [
+    "Apple shares rise after quarterly earnings beat expectations",
+    "Tesla cuts full-year delivery outlook as demand slows",
+]
+
+nlp_ner = None
+sentiment_pipeline = None
+fast_classifier = None
+_load_lock = threading.Lock()
+_artifacts_fingerprint = None
+
+def load_models():
+    """Loads the NER model and the sentiment backend once per process. Returns the seconds it took, 0 if already loaded."""
+    global nlp_ner, sentiment_pipeline, fast_classifier
+    if sentiment_pipeline is not None:
+        return 0.0
+    with _load_lock:
+        if sentiment_pipeline is not None:
+            return 0.0
+        started = time.perf_counter()
+        print("Loading models... This might take a moment.")
+        from gazetteer import GAZETTEER_MODE, load_ner_pipeline
+
+        nlp_ner = load_ner_pipeline(NER_MODEL_PATH)
+        print(f"NER model loaded ({' + '.join(nlp_ner.pipe_names)}, gazetteer mode {GAZETTEER_MODE})")
+        fast_classifier = load_fast_classifier()
+        if fast_classifier is not None:
+            print(f"Fast tier loaded (margin threshold {fast_classifier.margin})")
+        sentiment_pipeline = load_sentiment_backend()
+        print(f"Sentiment model loaded ({SENTIMENT_BACKEND} backend)")
+        return time.perf_counter() - started
+
+def warm_up():
+    """Runs a couple of texts through both models so the first real request does not pay for lazy initialization."""
+    started = time.perf_counter()
+    load_models()
+    run_models(WARMUP_TEXTS)  # bypasses the result cache, which would otherwise answer from the last run
+    return time.perf_counter() - started
+
+def classify_sentiment(texts, batch_size=ANALYSIS_BATCH_SIZE):
+    """Returns [(sentiment, confidence, tier)]. The fast tier answers when its probability margin is
+    at least the calibrated threshold, only the remaining texts are sent to the transformer."""
+    results = [None] * len(texts)
+    uncertain = list(range(len(texts)))
+    if fast_classifier is not None:
+        uncertain = []
+        with metrics.timer('inference_stage_seconds', stage='fast'):
+            predictions = fast_classifier.predict(texts)
+        for i, (label, margin, score) in enumerate(predictions):
+            if margin >= fast_classifier.margin:
+                results[i] = (label, score, 'fast')
+            else:
+                uncertain.append(i)
+        metrics.inc('inference_texts_total', len(texts) - len(uncertain), stage='fast')
+    if uncertain:
+        with metrics.timer('inference_stage_seconds', stage='transformer'):
+            transformer_results = sentiment_pipeline([texts[i] for i in uncertain], batch_size=batch_size, truncation=True)
+        for i, result in zip(uncertain, transformer_results):
+            results[i] = (result['label'].upper(), float(result['score']), 'transformer')
+        metrics.inc('inference_texts_total', len(uncertain), stage='transformer')
+    return results
+
+def run_models(texts, batch_size=ANALYSIS_BATCH_SIZE):
+    with metrics.timer('inference_stage_seconds', stage='ner'):
+        ner_docs = list(nlp_ner.pipe(texts, batch_size=batch_size))
+    sentiments = classify_sentiment(texts, batch_size)
+    return [
+        {
+            'companies': [ent.text for ent in ner_doc.ents],
+            'company_ids': [ent.kb_id_ or None for ent in ner_doc.ents],
+            'sentiment': sentiment,
+            'confidence': confidence,
+            'tier': tier,
+        }
+        for ner_doc, (sentiment, confidence, tier) in zip(ner_docs, sentiments)
+    ]
+
+def fingerprint_files(path, content=False):
+    """Hash of every file under `path` (a file or directory): its bytes if `content`, else its size and mtime."""
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    digest = hashlib.sha1()
+    for file in files:
+        digest.update(os.path.relpath(file, path).encode('utf-8'))
+        if content:
+            with open(file, 'rb') as f:
+                digest.update(f.read())
+        else:
+            stat = os.stat(file)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+def cache_version():
+    """MODEL_VERSION plus a fingerprint of what produces a result: the sentiment backend and its model
+    files, the NER model, the gazetteer file and the fast-tier bundle (its trained_at and margin live in
+    the file). Re-exporting, re-training, calibrating or rebuilding any of them starts a fresh cache."""
+    global _artifacts_fingerprint
+    if _artifacts_fingerprint is None:
+        from gazetteer import GAZETTEER_MODE, GAZETTEER_PATH
+
+        parts = [SENTIMENT_BACKEND, GAZETTEER_MODE, os.getenv("FAST_TIER_MARGIN", "")]
+        if SENTIMENT_BACKEND in ONNX_FILES:
+            parts.append(fingerprint_files(ONNX_MODEL_DIR))
+        else:
+            parts.append(SENTIMENT_MODEL_NAME)
+        if GAZETTEER_MODE != 'only':
+            parts.append(fingerprint_files(NER_MODEL_PATH))
+        if GAZETTEER_MODE != 'off':
+            parts.append(fingerprint_files(GAZETTEER_PATH, content=True))
+        parts.append(fingerprint_files(FAST_MODEL_PATH, content=True))
+        _artifacts_fingerprint = hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()[:12]
+    return f"{MODEL_VERSION}-{_artifacts_fingerprint}"
+
+def result_cache():
+    return get_result_cache(cache_version())
+
+def analyze_texts(texts, batch_size=ANALYSIS_BATCH_SIZE):
+    """Runs a batch of texts through both models, returns [{'companies', 'company_ids', 'sentiment', 'confidence', 'tier'}]
+    in input order. company_ids holds the gazetteer's canonical ID of each company, None if it is unknown.
+
+    Texts already analyzed by these models (up to small formatting differences) come from the result cache.
+    """
+    cache = result_cache()
+    with metrics.timer('inference_stage_seconds', stage='cache'):
+        results = cache.get_many(texts) if cache else {}
+    metrics.inc('inference_texts_total', len(results), stage='cache')
+    misses = [i for i in range(len(texts)) if i not in results]
+    if misses:
+        load_models()
+        miss_texts = [texts[i] for i in misses]
+        analyzed = run_models(miss_texts, batch_size)
+        if cache:
+            cache.put_many(miss_texts, analyzed)
+        results.update(zip(misses, analyzed))
+    return [results[i] for i in range(len(texts))]
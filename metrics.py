@@ -0,0 +1,173 @@
+"""In-process counters and latency histograms (p50/p95/p99 over the latest METRICS_RESERVOIR_SIZE observations).
+
+They cover scraper phases (launch, goto, wait, extract, clean, insert, kaggle), inference stages (result cache,
+NER, fast tier, transformer), worker claim/analyze/write and HTTP requests. The web app serves them at /metrics
+in Prometheus text format. The scraper and backfill write a JSON run summary to METRICS_DIR (output/metrics),
+and the worker refreshes worker.json there after each drained queue.
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+METRICS_DIR = os.getenv("METRICS_DIR", "output/metrics")
+# Latest observations kept per histogram for the percentiles, count and sum cover every observation
+RESERVOIR_SIZE = int(os.getenv("METRICS_RESERVOIR_SIZE", "2048"))
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Count, sum and a ring buffer of the latest values. Observing is an append, sorting happens on read."""
+
+    __slots__ = ('count', 'sum', 'recent')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantiles(self):
+        values = sorted(self.recent)
+        if not values:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in QUANTILES}
+
+
+class Registry:
+    """Process-wide counters and latency histograms, keyed by metric name and label values."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.descriptions = {}
+        self.started_at = datetime.now(timezone.utc)
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self.descriptions[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes the seconds spent in the block, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        """{'counters': {...}, 'histograms': {...}} with 'name{label="value"}' keys and p50/p95/p99 per histogram."""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (h.count, h.sum, h.quantiles()) for key, h in self.histograms.items()}
+        return {
+            'counters': {series_name(name, labels): value for (name, labels), value in sorted(counters.items())},
+            'histograms': {
+                series_name(name, labels): {
+                    'count': count, 'sum': total, 'mean': total / count if count else 0.0,
+                    **{f"p{round(q * 100)}": value for q, value in quantiles.items()},
+                }
+                for (name, labels), (count, total, quantiles) in sorted(histograms.items())
+            },
+        }
+
+    def render_prometheus(self, gauges=()):
+        """Prometheus text format. Histograms are exposed as summaries (quantiles, _sum, _count),
+        `gauges` is an iterable of (name, help, labels, value) for point-in-time values."""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (h.count, h.sum, h.quantiles())) for key, h in self.histograms.items())
+        lines = []
+        seen = set()
+
+        def header(name, kind, text=None):
+            if name not in seen:
+                seen.add(name)
+                text = text or self.descriptions.get(name)
+                if text:
+                    lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{series_name(name, labels)} {value}")
+        for (name, labels), (count, total, quantiles) in histograms:
+            header(name, 'summary')
+            for q, value in quantiles.items():
+                lines.append(f"{series_name(name, labels + (('quantile', str(q)),))} {value:.6f}")
+            lines.append(f"{series_name(name + '_sum', labels)} {total:.6f}")
+            lines.append(f"{series_name(name + '_count', labels)} {count}")
+        for name, text, labels, value in gauges:
+            header(name, 'gauge', text)
+            lines.append(f"{series_name(name, tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_run_summary(self, job, extra=None, timestamped=True):
+        """Writes the run's metrics as JSON under METRICS_DIR, one file per run unless `timestamped` is off."""
+        finished_at = datetime.now(timezone.utc)
+        summary = {
+            'job': job,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': finished_at.isoformat(),
+            'duration_seconds': (finished_at - self.started_at).total_seconds(),
+            **(extra or {}),
+            **self.snapshot(),
+        }
+        name = f"{job}-{finished_at.strftime('%Y%m%dT%H%M%SZ')}.json" if timestamped else f"{job}.json"
+        path = os.path.join(METRICS_DIR, name)
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(summary, f, indent=1)
+        os.replace(tmp_path, path)
+        return path
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def series_name(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels) + '}'
+
+
+REGISTRY = Registry()
+describe = REGISTRY.describe
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+snapshot = REGISTRY.snapshot
+render_prometheus = REGISTRY.render_prometheus
+write_run_summary = REGISTRY.write_run_summary
+
+describe("scraper_phase_seconds", "Seconds per scraping phase (launch, goto, wait, extract, clean, insert, kaggle).")
+describe("scraper_briefs_total", "Briefs scraped, inserted and linked as near-duplicates.")
+describe("inference_stage_seconds", "Seconds per analysis batch stage (cache, ner, fast, transformer).")
+describe("inference_texts_total", "Texts analyzed, by the stage that answered them.")
+describe("worker_stage_seconds", "Seconds per worker batch stage (claim, analyze, write).")
+describe("worker_briefs_total", "Briefs the worker finished, by outcome.")
+describe("backfill_stage_seconds", "Seconds per backfill chunk stage (sentiment, write).")
+describe("http_request_seconds", "Time until the response headers, by endpoint.")
+describe("http_requests_total", "HTTP requests, by endpoint and status code.")
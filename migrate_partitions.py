@@ -0,0 +1,22 @@
+import os
+import sys
+
+from db import connection, _create_schema, ensure_search_index
+from partitions import PARTITIONING, migrate_to_partitioned
+
+if __name__ == "__main__":
+    if not os.getenv("DATABASE_URL"):
+        raise ValueError("DATABASE_URL environment variable is not set.")
+
+    granularity = sys.argv[1] if len(sys.argv) > 1 else PARTITIONING
+    if granularity not in ('daily', 'monthly'):
+        raise ValueError("Usage: python migrate_partitions.py daily|monthly (or set BRIEFS_PARTITIONING)")
+
+    print(f"Migrating 'briefs' to {granularity} partitions. Writers are blocked until this finishes...")
+    # One transaction: on any error the original table is left untouched
+    with connection() as conn:
+        with conn.cursor() as cur:
+            if migrate_to_partitioned(cur, granularity):
+                _create_schema(cur)
+                ensure_search_index(cur)
+    print("Migration complete.")
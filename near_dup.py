@@ -0,0 +1,196 @@
+"""MinHash + LSH near-duplicate index over a sliding window of recent briefs (NEAR_DUP_WINDOW_HOURS).
+
+The scraper links re-published stories to their canonical brief instead of analyzing them again.
+'python near_dup.py bench' reports query latency, index size and recall on Data/SEntFiN-v1.1.csv.
+"""
+import os
+import re
+import sys
+import csv
+import time
+import array
+import random
+import hashlib
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from result_cache import normalize_text
+
+NUM_PERM = 128
+# 16 bands of 8 rows: pairs above ~0.7 Jaccard similarity almost always share a bucket
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 5
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP", "1") != "0"
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.7"))
+NEAR_DUP_WINDOW_HOURS = float(os.getenv("NEAR_DUP_WINDOW_HOURS", "48"))
+NEAR_DUP_MAX_ENTRIES = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "50000"))
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+# Fixed seed: signatures are stored in briefs.minhash and must stay comparable across runs
+_rng = random.Random(1)
+PERMUTATIONS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+NON_WORD = re.compile(r'[^a-z0-9 ]+')
+
+
+def shingles(text):
+    """Character 5-grams of the normalized, lowercased text; headlines are too short for word shingles."""
+    text = NON_WORD.sub('', normalize_text(text).lower())
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def minhash(text):
+    """128 32-bit MinHash values of the text's shingles, as an array('I')."""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little')
+              for s in shingles(text)]
+    return array.array('I', [
+        min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes)
+        for a, b in PERMUTATIONS
+    ])
+
+def signature_from_bytes(data):
+    signature = array.array('I')
+    signature.frombytes(bytes(data))
+    return signature
+
+def similarity(left, right):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(left, right) if x == y) / NUM_PERM
+
+def band_keys(signature):
+    return [(band, hash(tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]))) for band in range(LSH_BANDS)]
+
+
+class NearDuplicateIndex:
+    """Incremental MinHash LSH index over the briefs of a sliding time window.
+
+    Entries older than `window` (or beyond `max_entries`) are evicted as new ones arrive,
+    so memory stays bounded no matter how long the scraper has been running.
+    """
+
+    def __init__(self, window=timedelta(hours=NEAR_DUP_WINDOW_HOURS), max_entries=NEAR_DUP_MAX_ENTRIES,
+                 threshold=NEAR_DUP_THRESHOLD):
+        self.window = window
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.signatures = {}
+        self.buckets = {}
+        self._order = deque()  # (timestamp, key), oldest first
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def add(self, key, signature, timestamp):
+        if key in self.signatures:
+            return
+        self.signatures[key] = signature
+        for band_key in band_keys(signature):
+            # Lists rather than sets: almost every bucket holds a single key
+            self.buckets.setdefault(band_key, []).append(key)
+        self._order.append((timestamp, key))
+        self.evict(timestamp)
+
+    def remove(self, key):
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for band_key in band_keys(signature):
+            bucket = self.buckets.get(band_key)
+            if bucket is not None and key in bucket:
+                bucket.remove(key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def evict(self, now):
+        cutoff = now - self.window
+        while self._order and (self._order[0][0] < cutoff or len(self.signatures) > self.max_entries):
+            _, key = self._order.popleft()
+            self.remove(key)
+
+    def query(self, signature):
+        """Returns (key, similarity) of the most similar indexed entry at or above the threshold, or None."""
+        candidates = set()
+        for band_key in band_keys(signature):
+            candidates.update(self.buckets.get(band_key, ()))
+        best = None
+        for key in candidates:
+            score = similarity(signature, self.signatures[key])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (key, score)
+        return best
+
+    def size_bytes(self):
+        """Rough in-memory footprint of signatures and buckets."""
+        total = sys.getsizeof(self.signatures) + sys.getsizeof(self.buckets) + sys.getsizeof(self._order)
+        total += sum(sys.getsizeof(signature) for signature in self.signatures.values())
+        total += sum(sys.getsizeof(bucket) for bucket in self.buckets.values())
+        return total
+
+
+def load_recent_index(cur, window=timedelta(hours=NEAR_DUP_WINDOW_HOURS)):
+    """Builds the index from canonical briefs of the last window, keyed by content_hash.
+    Returns (index, {content_hash: id})."""
+    index = NearDuplicateIndex(window)
+    ids = {}
+    cur.execute("""
+        SELECT id, content_hash, content, scraped_at, minhash FROM briefs
+        WHERE scraped_at >= NOW() - %s AND duplicate_of IS NULL
+        ORDER BY scraped_at;
+    """, (window,))
+    for brief_id, content_hash, content, scraped_at, stored in cur.fetchall():
+        signature = signature_from_bytes(stored) if stored is not None else minhash(content)
+        index.add(content_hash, signature, scraped_at)
+        ids[content_hash] = brief_id
+    return index, ids
+
+def benchmark(path="Data/SEntFiN-v1.1.csv", variants=500):
+    """Index build time, query latency, index size and recall on reworded copies of SEntFiN titles."""
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        titles = [row['Title'] for row in csv.DictReader(f) if row['Title']]
+    start_time = datetime.now(timezone.utc)
+    index = NearDuplicateIndex(window=timedelta(days=365), max_entries=len(titles) + variants)
+
+    latencies = []
+    duplicates = 0
+    hashing = 0.0
+    for i, title in enumerate(titles):
+        started = time.perf_counter()
+        signature = minhash(title)
+        hashed = time.perf_counter()
+        match = index.query(signature)
+        latencies.append(time.perf_counter() - hashed)
+        hashing += hashed - started
+        if match:
+            duplicates += 1
+        else:
+            index.add(i, signature, start_time + timedelta(seconds=i))
+
+    # Re-published variants: ticker prefix, curly quotes, different case, a trailing link and one word dropped
+    rng = random.Random(0)
+    sample = rng.sample(range(len(titles)), min(variants, len(titles)))
+    found = 0
+    for i in sample:
+        words = titles[i].split()
+        if len(words) > 6:
+            del words[rng.randrange(len(words))]
+        reworded = ' '.join(words).upper().replace("'", "\u2019")
+        variant = f"$ABC - {reworded} https://t.co/{rng.randrange(10**6)}"
+        found += index.query(minhash(variant)) is not None
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+    print(f"{len(titles)} titles, {len(index)} indexed, {duplicates} near-duplicates "
+          f"(threshold {NEAR_DUP_THRESHOLD}, {LSH_BANDS}x{LSH_ROWS} bands)")
+    print(f"MinHash: {hashing / len(titles) * 1000:.3f} ms/doc")
+    print(f"Query latency: p50 {percentile(50):.3f} ms, p95 {percentile(95):.3f} ms, p99 {percentile(99):.3f} ms")
+    print(f"Index size: ~{index.size_bytes() / 1e6:.1f} MB, {len(index.buckets)} buckets")
+    print(f"Recall on {len(sample)} reworded copies: {found / len(sample):.1%}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        benchmark(sys.argv[2] if len(sys.argv) > 2 else "Data/SEntFiN-v1.1.csv")
+    else:
+        print("Usage: python near_dup.py bench [csv_path]")
@@ -0,0 +1,233 @@
+import os
+import re
+import json
+from datetime import datetime, timedelta, timezone
+
+# "none" keeps the classic single-table layout, "daily" / "monthly" range-partition briefs on scraped_at
+PARTITIONING = os.getenv("BRIEFS_PARTITIONING", "none")
+# Partitions are created this many days (daily) or months (monthly) ahead of the current one
+PARTITIONS_AHEAD = int(os.getenv("BRIEFS_PARTITIONS_AHEAD", "3"))
+# Optional age cap, whole partitions older than this are dropped. Unset means only the row cap applies.
+RETENTION_DAYS = int(os.getenv("BRIEFS_RETENTION_DAYS", "0"))
+
+PARTITION_NAME = re.compile(r'^briefs_p(\d{6}|\d{8})$')
+
+
+def is_partitioned(cur):
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('briefs');")
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+def current_granularity(cur):
+    """BRIEFS_PARTITIONING if set, otherwise whatever the existing partitions use."""
+    if PARTITIONING != 'none':
+        return PARTITIONING
+    partitions = list_partitions(cur)
+    if partitions and (partitions[-1][2] - partitions[-1][1]).days == 1:
+        return 'daily'
+    return 'monthly'
+
+def create_partitioned_table(cur):
+    """Creates briefs as a table range-partitioned on scraped_at.
+
+    Postgres cannot enforce UNIQUE(content_hash) across partitions, so deduplication moves to
+    brief_hashes, a small unpartitioned table that the insert path goes through first.
+    """
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS briefs_id_seq;")
+    cur.execute("""
+        CREATE TABLE briefs (
+            id INTEGER NOT NULL DEFAULT nextval('briefs_id_seq'),
+            content_hash TEXT NOT NULL,
+            content TEXT NOT NULL,
+            scraped_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            subject_company TEXT,
+            sentiment TEXT,
+            confidence REAL,
+            processed_at TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (id, scraped_at)
+        ) PARTITION BY RANGE (scraped_at);
+    """)
+    cur.execute("ALTER SEQUENCE briefs_id_seq OWNED BY briefs.id;")
+    cur.execute("CREATE TABLE briefs_default PARTITION OF briefs DEFAULT;")
+    cur.execute("CREATE INDEX IF NOT EXISTS briefs_content_hash_idx ON briefs (content_hash);")
+    create_hash_table(cur)
+
+def create_hash_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS brief_hashes (
+            content_hash TEXT PRIMARY KEY,
+            scraped_at TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS brief_hashes_scraped_at_idx ON brief_hashes (scraped_at);")
+
+def partition_bounds(start, granularity):
+    """Returns (name, lower, upper) of the partition holding the UTC date `start`."""
+    if granularity == 'monthly':
+        lower = start.replace(day=1)
+        upper = (lower + timedelta(days=32)).replace(day=1)
+        name = f"briefs_p{lower:%Y%m}"
+    else:
+        lower = start
+        upper = start + timedelta(days=1)
+        name = f"briefs_p{lower:%Y%m%d}"
+    return name, lower, upper
+
+def ensure_partitions(cur, granularity=None, ahead=PARTITIONS_AHEAD, since=None):
+    """Creates any missing partitions from `since` (default: yesterday) up to `ahead` periods in the future."""
+    granularity = granularity or current_granularity(cur)
+    today = datetime.now(timezone.utc).date()
+    day = since or today - timedelta(days=1)
+    if granularity == 'monthly':
+        last = partition_bounds(today, granularity)[1]
+        for _ in range(ahead):
+            last = partition_bounds(last, granularity)[2]
+    else:
+        last = today + timedelta(days=ahead)
+
+    created = 0
+    while day <= last:
+        name, lower, upper = partition_bounds(day, granularity)
+        cur.execute("SELECT to_regclass(%s) IS NULL;", (name,))
+        if cur.fetchone()[0]:
+            cur.execute("SAVEPOINT create_partition;")
+            try:
+                cur.execute(
+                    f"CREATE TABLE {name} PARTITION OF briefs FOR VALUES FROM (%s) TO (%s);",
+                    (f"{lower} 00:00+00", f"{upper} 00:00+00")
+                )
+                cur.execute("RELEASE SAVEPOINT create_partition;")
+                created += 1
+            except Exception as e:
+                # Usually rows for this range already sit in briefs_default
+                cur.execute("ROLLBACK TO SAVEPOINT create_partition;")
+                print(f"Could not create partition {name}: {e}")
+        day = upper
+    if created:
+        print(f"Created {created} new partition(s).")
+
+def list_partitions(cur):
+    """Returns [(name, lower_date, upper_date, estimated_rows)] for the managed partitions, oldest first."""
+    cur.execute("""
+        SELECT c.relname, COALESCE(s.n_live_tup, GREATEST(c.reltuples, 0)::bigint)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+        WHERE i.inhparent = 'briefs'::regclass;
+    """)
+    partitions = []
+    for name, rows in cur.fetchall():
+        match = PARTITION_NAME.match(name)
+        if not match:
+            continue
+        stamp = match.group(1)
+        if len(stamp) == 6:
+            _, lower, upper = partition_bounds(datetime.strptime(stamp, '%Y%m').date(), 'monthly')
+        else:
+            _, lower, upper = partition_bounds(datetime.strptime(stamp, '%Y%m%d').date(), 'daily')
+        partitions.append((name, lower, upper, rows))
+    return sorted(partitions, key=lambda p: p[1])
+
+def drop_partition(cur, name, lower, upper):
+    """Drops one partition together with its dedup hashes, rollup and company index rows."""
+    cur.execute(f"DROP TABLE {name};")
+    cur.execute("DELETE FROM brief_hashes WHERE scraped_at < %s;", (f"{upper} 00:00+00",))
+    cur.execute("DELETE FROM sentiment_daily WHERE day < %s;", (upper,))
+    cur.execute("DELETE FROM brief_companies WHERE scraped_at < %s;", (f"{upper} 00:00+00",))
+    # Row triggers do not fire on DROP, so tell the web app which days went away
+    day = lower
+    while day < upper:
+        cur.execute(
+            "SELECT pg_notify('new_brief_channel', %s);",
+            (json.dumps({'event': 'deleted', 'day': day.isoformat()}),)
+        )
+        day += timedelta(days=1)
+
+def apply_retention(cur, max_rows, max_age_days=RETENTION_DAYS):
+    """Drops whole partitions, oldest first, until the row cap and the optional age cap both hold."""
+    today = datetime.now(timezone.utc).date()
+    cutoff = today - timedelta(days=max_age_days) if max_age_days else None
+    partitions = list_partitions(cur)
+    total_rows = sum(rows for _, _, _, rows in partitions)
+
+    dropped = 0
+    for name, lower, upper, rows in partitions:
+        if upper > today:
+            break  # never drop the partition currently being written
+        too_old = cutoff is not None and upper <= cutoff
+        if not too_old and total_rows <= max_rows:
+            break
+        print(f"Dropping partition {name} (~{rows} rows)")
+        drop_partition(cur, name, lower, upper)
+        total_rows -= rows
+        dropped += 1
+
+    if dropped:
+        # Stragglers older than every remaining partition land in briefs_default, trim them as well
+        remaining = list_partitions(cur)
+        if remaining:
+            cur.execute("DELETE FROM briefs_default WHERE scraped_at < %s;", (f"{remaining[0][1]} 00:00+00",))
+    return dropped
+
+def migrate_to_partitioned(cur, granularity):
+    """Moves an existing single-table briefs into the partitioned layout. Run inside one transaction."""
+    if is_partitioned(cur):
+        print("Table 'briefs' is already partitioned.")
+        return False
+
+    cur.execute("LOCK TABLE briefs IN ACCESS EXCLUSIVE MODE;")
+    cur.execute("ALTER TABLE briefs RENAME TO briefs_unpartitioned;")
+    # Free up index and constraint names (briefs_pkey, briefs_queue_idx, ...) for the new table
+    cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'briefs_unpartitioned';")
+    for (index_name,) in cur.fetchall():
+        cur.execute(f"ALTER INDEX {index_name} RENAME TO {index_name}_unpartitioned;")
+    # Keep the id sequence so ids stay stable and keep counting up
+    cur.execute("ALTER TABLE briefs_unpartitioned ALTER COLUMN id DROP DEFAULT;")
+    cur.execute("ALTER SEQUENCE briefs_id_seq OWNED BY NONE;")
+
+    create_partitioned_table(cur)
+    cur.execute("SELECT MIN(scraped_at AT TIME ZONE 'UTC')::date FROM briefs_unpartitioned;")
+    oldest = cur.fetchone()[0]
+    ensure_partitions(cur, granularity, since=oldest)
+
+    # Bring over every column later setup steps added to the old table, with its default and NOT NULL
+    cur.execute("""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull, pg_get_expr(d.adbin, d.adrelid)
+        FROM pg_attribute a
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE a.attrelid = 'briefs_unpartitioned'::regclass AND a.attnum > 0
+        AND NOT a.attisdropped AND a.attgenerated = ''
+        AND a.attname NOT IN (SELECT column_name FROM information_schema.columns WHERE table_name = 'briefs')
+        ORDER BY a.attnum;
+    """)
+    for column_name, column_type, not_null, default in cur.fetchall():
+        definition = f"{column_name} {column_type}"
+        if default is not None:
+            definition += f" DEFAULT {default}"
+        if not_null:
+            definition += " NOT NULL"
+        cur.execute(f"ALTER TABLE briefs ADD COLUMN {definition};")
+
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = 'briefs_unpartitioned' AND is_generated = 'NEVER'
+        ORDER BY ordinal_position;
+    """)
+    columns = [row[0] for row in cur.fetchall()]
+    select_list = [
+        "COALESCE(scraped_at, processed_at, NOW())" if column == 'scraped_at' else column
+        for column in columns
+    ]
+    cur.execute(f"""
+        INSERT INTO briefs ({', '.join(columns)})
+        SELECT {', '.join(select_list)} FROM briefs_unpartitioned;
+    """)
+    moved = cur.rowcount
+    cur.execute("""
+        INSERT INTO brief_hashes (content_hash, scraped_at)
+        SELECT content_hash, scraped_at FROM briefs
+        ON CONFLICT (content_hash) DO NOTHING;
+    """)
+    cur.execute("DROP TABLE briefs_unpartitioned;")
+    print(f"Moved {moved} brief(s) into the {granularity} partitioned layout.")
+    return True
@@ -0,0 +1,19 @@
+import os
+
+from db import connection, rebuild_sentiment_rollup, rebuild_brief_companies
+
+if __name__ == "__main__":
+    if not os.getenv("DATABASE_URL"):
+        raise ValueError("DATABASE_URL environment variable is not set.")
+
+    print("Rebuilding 'sentiment_daily' from the full 'briefs' history...")
+    with connection() as conn:
+        with conn.cursor() as cur:
+            rows = rebuild_sentiment_rollup(cur)
+    print(f"Rollup rebuilt with {rows} (day, sentiment, band) rows.")
+
+    print("Rebuilding 'brief_companies' from the full 'briefs' history...")
+    with connection() as conn:
+        with conn.cursor() as cur:
+            rows = rebuild_brief_companies(cur)
+    print(f"Company index rebuilt with {rows} (brief, company) rows.")
@@ -0,0 +1,171 @@
+import os
+import gzip
+import json
+import time
+import select
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from db import connect_listener
+
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+# Safety net only: entries are normally dropped by new_brief_channel notifications long before this
+CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+
+
+class CacheEntry:
+    __slots__ = ('body', 'etag', 'headers', 'expires_at', '_gzipped')
+
+    def __init__(self, body, ttl, headers=None):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.headers = headers or {}
+        self.expires_at = time.monotonic() + ttl
+        self._gzipped = None
+
+    def gzipped(self):
+        """The body gzip-compressed, computed on first use and kept with the entry."""
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+class ResponseCache:
+    """Size-bounded LRU of serialized API responses with a TTL.
+
+    Keys are tuples whose first two items are the endpoint name and the date they describe,
+    so that a change on one day only drops the entries that can depend on it.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+        # Bumped on every invalidation, so a response built while data changed is not stored
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at < time.monotonic():
+                del self._entries[key]
+                self.stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+
+    def put(self, key, body, headers=None, generation=None):
+        """Stores a response. Skipped if `generation` (read before building it) is no longer current."""
+        entry = CacheEntry(body, self.ttl, headers)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return entry
+
+    def invalidate_day(self, day, companies=None):
+        """Drops every entry for `day`, plus summaries and dashboards of the month it belongs to,
+        movers of the following week (their baseline) and the timelines of `companies`
+        (company IDs; None drops every timeline)."""
+        week_after = (date.fromisoformat(day) + timedelta(days=7)).isoformat()
+        companies = None if companies is None else set(companies)
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if key[1] == day
+                or (key[0] in ('summary', 'dashboard') and key[1][:7] == day[:7])
+                or (key[0] == 'movers' and day <= key[1] <= week_after)
+                or (key[0] == 'company' and (companies is None or key[1] in companies))
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.stats['invalidations'] += len(stale)
+            self.generation += 1
+
+    def clear(self):
+        with self._lock:
+            self.stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self.generation += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+def _listen(cache, on_events=None):
+    """Drops cache entries for the day named in each new_brief_channel payload, forever.
+
+    `on_events`, if given, receives each drained batch of decoded payloads, or None when
+    notifications may have been missed (on every (re)connect).
+    """
+    while True:
+        conn = None
+        try:
+            conn = connect_listener("new_brief_channel")
+            # Anything may have changed while we were not listening
+            cache.clear()
+            _deliver(on_events, None)
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                events = []
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    try:
+                        event = json.loads(notification.payload)
+                        if event.get('event') != 'results':
+                            # Batch results from the worker, the row triggers already named their days
+                            cache.invalidate_day(event['day'], event.get('companies'))
+                        events.append(event)
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        cache.clear()
+                if events:
+                    _deliver(on_events, events)
+        except Exception as e:
+            print(f"Cache invalidation listener failed, retrying: {e}")
+            cache.clear()
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                conn.close()
+
+def _deliver(on_events, events):
+    if on_events is None:
+        return
+    try:
+        on_events(events)
+    except Exception as e:
+        print(f"Change event handler failed: {e}")
+
+
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+def start_invalidation_listener(cache, on_events=None):
+    """Starts one listener thread per process (gunicorn workers fork after import)."""
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        threading.Thread(target=_listen, args=(cache, on_events), daemon=True, name="cache-invalidation").start()
+        _listener_pid = os.getpid()
@@ -0,0 +1,210 @@
+"""On-disk LRU (SQLite) of NER and sentiment results, shared by the worker, backfill and analysis server.
+
+Entries are keyed by a normalized-text hash and inference.cache_version(), which combines MODEL_VERSION with a
+fingerprint of the model, gazetteer and fast-tier files. Entries of several versions are kept side by side until
+the LRU evicts them. 'python result_cache.py [--clear | --purge-versions]' prints the cache's size and hit rate;
+--purge-versions drops every version but the current one.
+"""
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE", "1") != "0"
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "output/result_cache.sqlite3")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "100000"))
+# SQLite caps the number of bound parameters per statement
+LOOKUP_CHUNK = 500
+# LRU touches and hit counters are buffered and written once this many keys were touched or this many
+# seconds passed, so lookups stay read-only
+FLUSH_EVERY = 1000
+FLUSH_INTERVAL = 5.0
+
+QUOTES = str.maketrans({'‘': "'", '’': "'", '‚': "'", '‛': "'",
+                        '“': '"', '”': '"', '„': '"', '‟': '"', '´': "'", '`': "'"})
+TICKER_PREFIX = re.compile(r'^(?:\$[A-Za-z][A-Za-z.]*[\s,]*)+[-–—:]\s*')
+URL = re.compile(r'https?://\S+|www\.\S+')
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Folds the differences re-published briefs usually have: unicode forms, curly quotes,
+    a leading '$TICKER -' prefix, links and whitespace."""
+    text = unicodedata.normalize('NFKC', text).translate(QUOTES)
+    text = URL.sub(' ', text)
+    text = WHITESPACE.sub(' ', text).strip()
+    return TICKER_PREFIX.sub('', text)
+
+def cache_key(text, model_version):
+    return hashlib.sha256(f"{model_version}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Size-bounded on-disk LRU of analysis results (companies, sentiment, confidence, tier), in SQLite
+    so the worker, backfill and run_analysis.py share it across processes. Entries of several model
+    versions live side by side, so a re-score with another version does not wipe the worker's entries."""
+
+    def __init__(self, model_version, path=RESULT_CACHE_PATH, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        self._puts_since_trim = 0
+        self._touched = {}
+        self._pending = {'hits': 0, 'misses': 0}
+        self._flushed_at = time.monotonic()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                model_version TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                last_used REAL NOT NULL
+            );
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_last_used_idx ON results (last_used);")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);")
+        atexit.register(self.flush)
+
+    def get_many(self, texts):
+        """Returns {index: result} for the texts that have a cached result under the current model version."""
+        keys = [cache_key(text, self.model_version) for text in texts]
+        found = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), LOOKUP_CHUNK):
+                chunk = unique_keys[start:start + LOOKUP_CHUNK]
+                rows = self.conn.execute(
+                    f"SELECT key, payload FROM results WHERE key IN ({','.join('?' * len(chunk))});", chunk
+                ).fetchall()
+                found.update(rows)
+            now = time.time()
+            for key in found:
+                self._touched[key] = now
+            hits = sum(1 for key in keys if key in found)
+            self.stats['hits'] += hits
+            self.stats['misses'] += len(keys) - hits
+            self._pending['hits'] += hits
+            self._pending['misses'] += len(keys) - hits
+            if len(self._touched) >= FLUSH_EVERY or time.monotonic() - self._flushed_at >= FLUSH_INTERVAL:
+                self._flush()
+        return {i: json.loads(found[key]) for i, key in enumerate(keys) if key in found}
+
+    def put_many(self, texts, results):
+        now = time.time()
+        rows = [
+            (cache_key(text, self.model_version), self.model_version, json.dumps(result), now)
+            for text, result in zip(texts, results)
+        ]
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?);", rows)
+            self._puts_since_trim += len(rows)
+            # Trimming scans the LRU index, so let the table overshoot by 1% between trims
+            if self._puts_since_trim > max(1, self.max_entries // 100):
+                self._flush()
+                self._trim()
+
+    def _trim(self):
+        self._puts_since_trim = 0
+        self._touched = {}
+        self._pending = {'hits': 0, 'misses': 0}
+        self._flushed_at = time.monotonic()
+        self.conn.execute("""
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            );
+        """, (self.max_entries,))
+
+    def flush(self):
+        """Writes the buffered LRU touches and hit counters."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._flushed_at = time.monotonic()
+        if not self._touched and not any(self._pending.values()):
+            return
+        self.conn.execute("BEGIN;")
+        try:
+            self.conn.executemany(
+                "UPDATE results SET last_used = max(last_used, ?) WHERE key = ?;",
+                [(last_used, key) for key, last_used in self._touched.items()]
+            )
+            self.conn.executemany(
+                "INSERT INTO counters VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;",
+                list(self._pending.items())
+            )
+            self.conn.execute("COMMIT;")
+        except sqlite3.Error:
+            self.conn.execute("ROLLBACK;")
+            raise
+        self._touched = {}
+        self._pending = {'hits': 0, 'misses': 0}
+
+    def snapshot(self):
+        """Hit rate of this process and since the cache file was created, plus its size."""
+        with self._lock:
+            self._flush()
+            entries = self.conn.execute("SELECT COUNT(*) FROM results;").fetchone()[0]
+            totals = dict(self.conn.execute("SELECT name, value FROM counters;").fetchall())
+        lookups = self.stats['hits'] + self.stats['misses']
+        total_lookups = totals.get('hits', 0) + totals.get('misses', 0)
+        return {
+            'model_version': self.model_version,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'hits': self.stats['hits'],
+            'misses': self.stats['misses'],
+            'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+            'total_hit_rate': totals.get('hits', 0) / total_lookups if total_lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._touched = {}
+            self._pending = {'hits': 0, 'misses': 0}
+            self.conn.execute("DELETE FROM results;")
+            self.conn.execute("DELETE FROM counters;")
+
+    def purge_versions(self):
+        """Deletes the entries of every model version but this cache's own, returns how many."""
+        with self._lock:
+            return self.conn.execute("DELETE FROM results WHERE model_version <> ?;", (self.model_version,)).rowcount
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_result_cache(model_version):
+    """Returns the process-wide cache for `model_version` (reopened if the version changed), or None if disabled."""
+    global _cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.model_version != model_version:
+            if _cache is not None:
+                _cache.flush()
+            _cache = ResultCache(model_version)
+        return _cache
+
+if __name__ == "__main__":
+    from inference import cache_version
+
+    cache = ResultCache(cache_version())
+    if "--clear" in sys.argv[1:]:
+        cache.clear()
+        print("Result cache cleared.")
+    elif "--purge-versions" in sys.argv[1:]:
+        print(f"Result cache: dropped {cache.purge_versions()} entries of other model versions.")
+    stats = cache.snapshot()
+    print(f"Result cache {RESULT_CACHE_PATH}: {stats['entries']}/{stats['max_entries']} entries "
+          f"for model version {stats['model_version']}, lifetime hit rate {stats['total_hit_rate']:.1%}")
@@ -1,72 +1,115 @@
-import spacy
-from transformers import pipeline
-import torch
-
-NER_MODEL_PATH = "output/model-best"
-
-SENTIMENT_MODEL_NAME = "KOlCi/distilbert-financial-sentiment"
-
-print("Loading models... This might take a moment.")
-
-# Load the custom SpaCy NER model
-try:
-    nlp_ner = spacy.load(NER_MODEL_PATH)
-    print(f"NER model loaded")
-except OSError:
-    print(f"Could not load SpaCy model.")
-    exit()
-
-device = 0 if torch.cuda.is_available() else -1 # Use GPU if available, otherwise CPU
-try:
-    sentiment_pipeline = pipeline(
-        "sentiment-analysis",
-        model=SENTIMENT_MODEL_NAME,
-        device=device
-    )
-    print(f"sentiment model loaded")
-except Exception as e:
-    print(f"Could not load model.")
-    print(f"e")
-    exit()
-
-
-def analyze_text(text: str):
+import os
+import sys
+import csv
+import json
+import time
+
+import inference
+from analysis_server import connect_client
+
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "64"))
+
+
+def get_analyzer():
+    """Returns (analyze_texts, startup_seconds, cache_stats), through the warm analysis server when one is running."""
+    started = time.perf_counter()
+    client = connect_client()
+    if client is not None:
+        print("Using the running analysis server.", file=sys.stderr)
+        return client.analyze_texts, time.perf_counter() - started, lambda: client.health()['result_cache']
+    print("No analysis server running (start one with 'python analysis_server.py'), loading models locally...",
+          file=sys.stderr)
+    inference.load_models()
+    cache = inference.result_cache()
+    return inference.analyze_texts, time.perf_counter() - started, lambda: cache.snapshot() if cache else None
+
+def analyze_text(text: str, analyze_texts=None):
     """
     Runs a line of text through both the NER and sentiment models.
     """
+    if analyze_texts is None:
+        analyze_texts, _, _ = get_analyzer()
     print("\n" + "="*50)
     print(f"Analyzing text: '{text}'")
 
-    ner_doc = nlp_ner(text)
-    companies = [ent.text for ent in ner_doc.ents]
-    sentiment_result = sentiment_pipeline(text)
-    sentiment = sentiment_result[0]['label'].upper()
-    score = sentiment_result[0]['score']
-    score = str(f"{score:.4f}")
-    sentiment = sentiment + "Confidence: " + score
+    result = analyze_texts([text])[0]
+    companies = result['companies']
+    sentiment = result['sentiment'] + "Confidence: " + f"{result['confidence']:.4f}"
 
     # Display the results
     print("-" * 20)
-    #print(f"Sentiment: {sentiment} (Score: {score:.4f})")
     print(sentiment)
-    
+
     if companies:
         print(f"Companies Found: {', '.join(companies)}")
     else:
         print("Companies Found: None")
     print("="*50)
 
-
-if __name__ == "__main__":
-
-    headline = input("Insert the headline to analyze:")
-    analyze_text(headline)
-
-    """ # Test sentences to analyze
-    test_sentences = [
-    ]
-
-    for sentence in test_sentences:
-        analyze_text(sentence) """
+def read_records(f):
+    """Yields dicts with at least a 'text' key from JSONL, CSV with a 'text' column, or plain lines."""
+    first = f.readline()
+    if not first:
+        return
+    if first.lstrip().startswith('{'):
+        for line in _chain(first, f):
+            if line.strip():
+                yield json.loads(line)
+    elif 'text' in next(csv.reader([first])):
+        yield from csv.DictReader(_chain(first, f))
+    else:
+        for line in _chain(first, f):
+            if line.strip():
+                yield {'text': line.rstrip('\n')}
+
+def _chain(first, f):
+    yield first
+    yield from f
+
+def stream_analysis(f, out, analyze_texts, batch_size=STREAM_BATCH_SIZE):
+    """Analyzes records from `f` in batches, writing each record plus its results to `out` as JSONL as it goes."""
+    started = time.perf_counter()
+    first_result = None
+    done = 0
+    batch = []
+
+    def flush():
+        nonlocal first_result, done
+        results = analyze_texts([str(record.get('text') or '') for record in batch])
+        for record, result in zip(batch, results):
+            out.write(json.dumps(dict(record, **result)) + "\n")
+        out.flush()
+        if first_result is None:
+            first_result = time.perf_counter() - started
+        done += len(batch)
+        batch.clear()
+
+    for record in read_records(f):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    elapsed = time.perf_counter() - started
+    return done, first_result, elapsed
 
 
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "--stream":
+        analyze_texts, startup, cache_stats = get_analyzer()
+        path = args[1] if len(args) > 1 and args[1] != '-' else None
+        with (open(path, newline='', encoding='utf-8') if path else sys.stdin) as f:
+            done, first_result, elapsed = stream_analysis(f, sys.stdout, analyze_texts)
+        rate = done / elapsed if elapsed else 0.0
+        first = f"{first_result:.2f}s" if first_result is not None else "n/a"
+        print(f"Startup {startup:.2f}s, first result after {first}, {done} docs in {elapsed:.2f}s ({rate:.1f} docs/sec)",
+              file=sys.stderr)
+        stats = cache_stats()
+        if stats:
+            print(f"Result cache hit rate {stats['hit_rate']:.1%} ({stats['entries']} entries)", file=sys.stderr)
+    else:
+        analyze_texts, startup, _ = get_analyzer()
+        print(f"Ready after {startup:.2f}s", file=sys.stderr)
+        headline = " ".join(args) if args else input("Insert the headline to analyze:")
+        analyze_text(headline, analyze_texts)
@@ -1,80 +1,191 @@
 import re
 import os
-import psycopg2
+import sys
+import time
+import asyncio
 import hashlib
+import psycopg2.extras
 
 from datetime import datetime, timedelta, timezone
 from playwright.sync_api import sync_playwright, TimeoutError
+from playwright.async_api import async_playwright, TimeoutError as AsyncTimeoutError
 from playwright_stealth import Stealth
 
+import metrics
+from db import connection, setup_database
+from partitions import is_partitioned, ensure_partitions, apply_retention
+from near_dup import NEAR_DUP_ENABLED, load_recent_index, minhash
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 MAX_ENTRIES = 300000
 MIN_BRIEF_LENGTH = 180
 MAX_BRIEF_LENGTH = 8000
 KAGGLE_NOTEBOOK_ID = "kolci017/financial-news-analyzer"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36"
+SECTIONS_TO_SCRAPE = ["Briefs", "Press Releases"]
+
+# "sync" is the original one-page scraper, "async" the parallel, resource-blocking one
+SCRAPER_MODE = os.getenv("SCRAPER_MODE", "sync")
+# Pages scraped concurrently in async mode, all on one browser context
+SCRAPE_URLS = [url.strip() for url in os.getenv("SCRAPE_URLS", "https://newsfilter.io").split(",") if url.strip()]
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "4"))
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "facebook.net", "hotjar.com", "segment.io", "segment.com", "mixpanel.com", "amplitude.com",
+    "intercom.io", "sentry.io", "clarity.ms",
+)
+
+# Mirrors the 'div:has-text("<section>") + div a' selectors of the sync scraper, but collects
+# the text of every anchor of every section in a single round trip to the browser
+EXTRACT_SECTIONS_JS = """
+(sections) => {
+    const divs = Array.from(document.querySelectorAll('div'));
+    const result = {};
+    for (const section of sections) {
+        const needle = section.toLowerCase();
+        const seen = new Set();
+        const texts = [];
+        for (const div of divs) {
+            if (!div.textContent.toLowerCase().includes(needle)) continue;
+            const next = div.nextElementSibling;
+            if (!next || next.tagName !== 'DIV') continue;
+            for (const anchor of next.querySelectorAll('a')) {
+                if (seen.has(anchor)) continue;
+                seen.add(anchor);
+                texts.push(anchor.textContent);
+            }
+        }
+        result[section] = texts;
+    }
+    return result;
+}
+"""
 
-def setup_database():
-    """Ensures the 'briefs' table exists in the database."""
-    conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor()
+def estimate_brief_count(cur):
+    """Cheap row count from the statistics collector, instead of a full COUNT over briefs."""
     cur.execute("""
-        CREATE TABLE IF NOT EXISTS briefs (
-            id SERIAL PRIMARY KEY,
-            content_hash TEXT UNIQUE NOT NULL,
-            content TEXT NOT NULL,
-            scraped_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-            subject_company TEXT,
-            sentiment TEXT,
-            confidence REAL,
-            processed_at TIMESTAMP WITH TIME ZONE
+        SELECT COALESCE(
+            (SELECT n_live_tup FROM pg_stat_user_tables WHERE relid = 'briefs'::regclass),
+            (SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = 'briefs'::regclass)
         );
     """)
-    cur.execute("ALTER TABLE briefs ADD COLUMN IF NOT EXISTS confidence REAL;")
-    conn.commit()
-    cur.close()
-    conn.close()
-    print("Database setup complete. Table 'briefs' is ready.")
+    return cur.fetchone()[0] or 0
+
+INSERT_COLUMNS = "content_hash, content, scraped_at, minhash, status, duplicate_of"
+
+def insert_briefs(cur, partitioned, rows):
+    """Inserts (content_hash, content, scraped_at, minhash, status, duplicate_of) rows in one statement,
+    skipping already stored hashes. Returns [(id, content_hash)] of the inserted rows."""
+    if not rows:
+        return []
+    if partitioned:
+        # No global UNIQUE(content_hash) across partitions, brief_hashes is the dedup gate
+        query = f"""
+            WITH incoming ({INSERT_COLUMNS}) AS (VALUES %s),
+            new AS (
+                INSERT INTO brief_hashes (content_hash, scraped_at)
+                SELECT content_hash, scraped_at FROM incoming
+                ON CONFLICT (content_hash) DO NOTHING
+                RETURNING content_hash
+            )
+            INSERT INTO briefs ({INSERT_COLUMNS})
+            SELECT i.* FROM incoming i JOIN new USING (content_hash)
+            RETURNING id, content_hash;
+        """
+    else:
+        query = f"INSERT INTO briefs ({INSERT_COLUMNS}) VALUES %s ON CONFLICT (content_hash) DO NOTHING RETURNING id, content_hash;"
+    return psycopg2.extras.execute_values(
+        cur,
+        query,
+        rows,
+        template="(%s, %s, %s::timestamptz, %s::bytea, %s, %s::integer)",
+        page_size=len(rows),
+        fetch=True
+    )
+
+def split_near_duplicates(cur, rows):
+    """Checks each new brief against the MinHash index of recent briefs (and of the batch so far).
+    Returns (canonical rows, [(row, canonical content_hash)], {content_hash: id} of indexed briefs)."""
+    if not NEAR_DUP_ENABLED:
+        return [(content_hash, content, published_at, None, 'pending', None)
+                for content_hash, content, published_at in rows], [], {}
+    index, known_ids = load_recent_index(cur)
+    canonical, duplicates = [], []
+    for content_hash, content, published_at in rows:
+        signature = minhash(content)
+        match = index.query(signature)
+        if match is not None and match[0] == content_hash:
+            continue  # exact duplicate of a stored brief
+        row = (content_hash, content, published_at, psycopg2.Binary(signature.tobytes()), 'pending', None)
+        if match is not None:
+            duplicates.append((row, match[0]))
+        else:
+            canonical.append(row)
+            index.add(content_hash, signature, published_at)
+    return canonical, duplicates, known_ids
 
 def save_brief_to_db(briefs):
+    """Inserts all scraped briefs and returns the hashes of the new ones queued for analysis.
+
+    Near-duplicates of a recent brief are stored linked to it (status 'duplicate') and never analyzed.
+    """
     if not briefs:
         print("Empty brief, skipping save.")
-        return
-    conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor()
+        return []
 
-    new_briefs = 0
+    # Hash on the client and drop in-batch duplicates so a single INSERT can take the whole batch
+    rows = {}
     for content, published_at in briefs:
         content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
-        try:
-            cur.execute(
-                "INSERT INTO briefs (content_hash, content, scraped_at) VALUES (%s, %s, %s) ON CONFLICT (content_hash) DO NOTHING;",
-                (content_hash, content, published_at)
-            )
-            if cur.rowcount > 0:
-                new_briefs += 1
-        except Exception as e:
-            print(f"An unexpected error occurred during insert: {e}")
-            conn.rollback()
-            
-    conn.commit()
-    print(f"Successfully inserted {new_briefs} entries")
-
-    cur.execute("SELECT COUNT(id) FROM briefs;")
-    total_rows = cur.fetchone()[0]
-    if total_rows > MAX_ENTRIES:
-        delete = total_rows - MAX_ENTRIES
-        print(f"Exceeded max, removing {delete}")
-        cur.execute("""
-                    DELETE FROM briefs
-                    WHERE id IN (
-                        SELECT id FROM briefs ORDER BY scraped_at ASC LIMIT %s
-                    );
-                    """, (delete,))
-        conn.commit()
-        print(f"Successfully removed {delete}")
-
-    cur.close()
-    conn.close()
+        rows.setdefault(content_hash, (content_hash, content, published_at))
+
+    with connection() as conn:
+        with conn.cursor() as cur:
+            partitioned = is_partitioned(cur)
+            canonical, duplicates, known_ids = split_near_duplicates(cur, list(rows.values()))
+            inserted = insert_briefs(cur, partitioned, canonical)
+            new_hashes = [content_hash for _, content_hash in inserted]
+            known_ids.update((content_hash, brief_id) for brief_id, content_hash in inserted)
+
+            if duplicates:
+                # Canonicals from this batch that were already stored did not come back from the INSERT
+                missing = list({canonical_hash for _, canonical_hash in duplicates} - known_ids.keys())
+                if missing:
+                    cur.execute("SELECT content_hash, id FROM briefs WHERE content_hash = ANY(%s);", (missing,))
+                    known_ids.update(cur.fetchall())
+                linked = insert_briefs(cur, partitioned, [
+                    row[:4] + ('duplicate', known_ids.get(canonical_hash))
+                    for row, canonical_hash in duplicates
+                ])
+            else:
+                linked = []
+            conn.commit()
+            metrics.inc('scraper_briefs_total', len(linked), outcome='near_duplicate')
+            print(f"Successfully inserted {len(new_hashes)} entries, linked {len(linked)} near-duplicate(s) "
+                  f"({len(rows) - len(new_hashes) - len(linked)} already stored)")
+
+            if partitioned:
+                # Retention drops whole partitions, no sort and no row-by-row delete
+                ensure_partitions(cur)
+                dropped = apply_retention(cur, MAX_ENTRIES)
+                conn.commit()
+                if dropped:
+                    print(f"Successfully dropped {dropped} partition(s)")
+            else:
+                total_rows = estimate_brief_count(cur)
+                if total_rows > MAX_ENTRIES:
+                    delete = total_rows - MAX_ENTRIES
+                    print(f"Exceeded max, removing {delete}")
+                    cur.execute("""
+                                DELETE FROM briefs
+                                WHERE id IN (
+                                    SELECT id FROM briefs ORDER BY scraped_at ASC LIMIT %s
+                                );
+                                """, (delete,))
+                    conn.commit()
+                    print(f"Successfully removed {delete}")
+    return new_hashes
 
 def parse_time(time_str: str) -> datetime:
     now = datetime.now(timezone.utc)
@@ -91,12 +202,39 @@ def parse_time(time_str: str) -> datetime:
         return now - timedelta(days=value)
     return now
 
-def scrape_and_filter_briefs():
+def clean_brief_text(full_text):
+    """Turns a raw anchor text into (text, published_at), or None for items to skip."""
+    time = parse_time(full_text)
+    if re.match(r'\d+D',full_text):
+        # Skip items with more than 1 day old
+        return None
+    # Remove quotes
+    full_text = full_text.replace('"', "").replace("'", "")
+    # Remove parenthesis
+    full_text = re.sub(r'\([^)]*\)', '', full_text)
+    # Remove time m,h
+    full_text = re.sub(r'\d+m ', '', full_text)
+    full_text = re.sub(r'\d+h ', '', full_text)
+    # Remove ago
+    full_text = re.sub(r'ago','',full_text)
+    # Remove the symbol
+    for i in range(len(full_text)):
+        if full_text[i].islower():
+            full_text = full_text[i-1:]
+            break
+    full_text = ' '.join(full_text.split())
+    if not full_text:
+        return None
+    return (full_text, time)
+
+def scrape_and_filter_briefs(timer=None):
+    timer = timer or PhaseTimer()
     filtered_briefs = []
     with sync_playwright() as p:
+        started = time.perf_counter()
         browser = p.chromium.launch(headless=True)
         context = browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36"
+            user_agent=USER_AGENT
         )
         try:
             all_items_text = [] 
@@ -104,51 +242,39 @@ def scrape_and_filter_briefs():
             stealth = Stealth()
             stealth.apply_stealth_sync(context)
             page = context.new_page()
+            timer.record("launch", started)
 
             print("Navigating to https://newsfilter.io...")
+            started = time.perf_counter()
             page.goto("https://newsfilter.io", timeout=60000, wait_until="domcontentloaded")
+            timer.record("goto", started)
 
             # Wait for the page skeleton (the "Briefs" heading)
             briefs_heading_selector = 'div:has-text("Briefs")'
             print(f"Waiting for page skeleton ('{briefs_heading_selector}')...")
+            started = time.perf_counter()
             page.wait_for_selector(briefs_heading_selector, timeout=30000)
             
             # Wait for the first news item under "Briefs" to load
             first_item_selector = f'{briefs_heading_selector} + div a'
             print(f"Waiting for dynamic content ('{first_item_selector}')...")
             page.wait_for_selector(first_item_selector, timeout=30000)
+            timer.record("wait", started)
             print("Dynamic content loaded.")
 
-            sections_to_scrape = ["Briefs", "Press Releases"]
-            
             print("\nScraping all news sections...")
-            for section in sections_to_scrape:
+            for section in SECTIONS_TO_SCRAPE:
                 article_selector = f'div:has-text("{section}") + div a'
-                list_items = page.query_selector_all(article_selector)
-
-                for item in list_items:
-                    full_text = item.text_content()
-                    time = parse_time(full_text)
-                    if re.match(r'\d+D',full_text):
-                        # Skip items with more than 1 day old
-                        continue
-                    # Remove quotes
-                    full_text = full_text.replace('"', "").replace("'", "")
-                    # Remove parenthesis
-                    full_text = re.sub(r'\([^)]*\)', '', full_text)
-                    # Remove time m,h
-                    full_text = re.sub(r'\d+m ', '', full_text)
-                    full_text = re.sub(r'\d+h ', '', full_text)
-                    # Remove ago
-                    full_text = re.sub(r'ago','',full_text)
-                    # Remove the symbol
-                    for i in range(len(full_text)):
-                        if full_text[i].islower():
-                            full_text = full_text[i-1:]
-                            break
-                    full_text = ' '.join(full_text.split())
-                    if full_text:
-                        all_items_text.append((full_text,time))
+                started = time.perf_counter()
+                raw_texts = [item.text_content() for item in page.query_selector_all(article_selector)]
+                timer.record("extract", started)
+
+                started = time.perf_counter()
+                for text in raw_texts:
+                    cleaned = clean_brief_text(text)
+                    if cleaned:
+                        all_items_text.append(cleaned)
+                timer.record("clean", started)
             print(f"\nFiltering for items with more than {MIN_BRIEF_LENGTH} characters...")
             filtered_briefs = [
                 item for item in all_items_text if len(item[0]) > MIN_BRIEF_LENGTH
@@ -172,10 +298,99 @@ def scrape_and_filter_briefs():
 
         finally:
             print("Closing the browser.")
+            started = time.perf_counter()
             browser.close()
+            timer.record("close", started)
+            timer.report()
             
     return filtered_briefs
 
+class PhaseTimer:
+    """Accumulates wall-clock seconds per scraping phase, prints a breakdown and feeds scraper_phase_seconds."""
+
+    def __init__(self):
+        self.totals = {}
+
+    def record(self, phase, started):
+        elapsed = time.perf_counter() - started
+        self.totals[phase] = self.totals.get(phase, 0.0) + elapsed
+        metrics.observe('scraper_phase_seconds', elapsed, phase=phase)
+
+    def report(self):
+        print("Scrape timings: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.totals.items()))
+
+async def block_unneeded_requests(route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(host in request.url for host in BLOCKED_HOSTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def scrape_page_async(context, url, timer, semaphore):
+    """Loads one page and returns the raw anchor texts of every section, in one evaluate call."""
+    async with semaphore:
+        page = await context.new_page()
+        try:
+            started = time.perf_counter()
+            await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+            timer.record("goto", started)
+
+            started = time.perf_counter()
+            await page.wait_for_selector(f'div:has-text("{SECTIONS_TO_SCRAPE[0]}") + div a', timeout=30000)
+            timer.record("wait", started)
+
+            started = time.perf_counter()
+            sections = await page.evaluate(EXTRACT_SECTIONS_JS, SECTIONS_TO_SCRAPE)
+            timer.record("extract", started)
+            print(f"{url}: " + ", ".join(f"{len(texts)} {section}" for section, texts in sections.items()))
+            return [text for texts in sections.values() for text in texts]
+        except AsyncTimeoutError as e:
+            print(f"\nTimeout Error on {url}: {e.message}")
+            await page.screenshot(path="error_timeout_final.png")
+            print("An error screenshot has been saved.")
+            return []
+        finally:
+            await page.close()
+
+async def scrape_and_filter_briefs_async(urls=None, timer=None):
+    """Scrapes every URL concurrently on one reused browser context, with images, fonts, media and analytics blocked."""
+    urls = urls or SCRAPE_URLS
+    timer = timer or PhaseTimer()
+    filtered_briefs = []
+    async with async_playwright() as p:
+        started = time.perf_counter()
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context(user_agent=USER_AGENT)
+        await Stealth().apply_stealth_async(context)
+        await context.route("**/*", block_unneeded_requests)
+        timer.record("launch", started)
+        try:
+            semaphore = asyncio.Semaphore(SCRAPE_CONCURRENCY)
+            results = await asyncio.gather(
+                *(scrape_page_async(context, url, timer, semaphore) for url in urls),
+                return_exceptions=True
+            )
+
+            started = time.perf_counter()
+            all_items_text = []
+            for url, texts in zip(urls, results):
+                if isinstance(texts, Exception):
+                    print(f"An unexpected error occurred while scraping {url}: {texts}")
+                    continue
+                for text in texts:
+                    cleaned = clean_brief_text(text)
+                    if cleaned:
+                        all_items_text.append(cleaned)
+            filtered_briefs = [item for item in all_items_text if len(item[0]) > MIN_BRIEF_LENGTH]
+            timer.record("clean", started)
+            print(f"\nFound {len(filtered_briefs)} Filtered Briefs out of {len(all_items_text)} items")
+        finally:
+            started = time.perf_counter()
+            await browser.close()
+            timer.record("close", started)
+            timer.report()
+    return filtered_briefs
+
 def trigger_kaggle_notebook():
     print(f"\n--- Triggering Kaggle Analysis on notebook: {KAGGLE_NOTEBOOK_ID} ---")
     command = f"kaggle kernels push -p ."
@@ -192,18 +407,31 @@ def main():
     if not KAGGLE_NOTEBOOK_ID or "your-kaggle-username" in KAGGLE_NOTEBOOK_ID:
         raise Exception("KAGGLE_NOTEBOOK_ID is not configured. Please edit the script.")
         
+    timer = PhaseTimer()
     try:
         print("--- Starting Scraping ---")
         setup_database()
-        scraped = scrape_and_filter_briefs()
+        if SCRAPER_MODE == "async" or "--async" in sys.argv[1:]:
+            scraped = asyncio.run(scrape_and_filter_briefs_async(timer=timer))
+        else:
+            scraped = scrape_and_filter_briefs(timer)
+        metrics.inc('scraper_briefs_total', len(scraped), outcome='scraped')
         if scraped:
             print(f"Scraped {len(scraped)} entries, saving to DB...")
-            save_brief_to_db(scraped)
+            started = time.perf_counter()
+            new_hashes = save_brief_to_db(scraped)
+            timer.record("insert", started)
+            metrics.inc('scraper_briefs_total', len(new_hashes), outcome='inserted')
+            print(f"{len(new_hashes)} new brief(s) queued for analysis.")
         else:
             print("Scraper finished but found no new entries to save.")
         print("--- Finished Scraping ---")
     finally:
+        started = time.perf_counter()
         trigger_kaggle_notebook()
+        timer.record("kaggle", started)
+        path = metrics.write_run_summary('scraper', {'mode': SCRAPER_MODE, 'phase_seconds': timer.totals})
+        print(f"Run summary written to {path}")
         print("--- Process Complete ---")
 
 
@@ -0,0 +1,183 @@
+"""Pluggable sentiment backend, selected with SENTIMENT_BACKEND=torch|onnx|onnx-int8.
+
+'python sentiment_backend.py export' writes the ONNX and int8-quantized models, 'python sentiment_backend.py
+parity' compares accuracy and speed on Data/sent_valid.csv.
+"""
+import os
+import sys
+import csv
+import time
+
+import numpy as np
+
+SENTIMENT_MODEL_NAME = "KOlCi/distilbert-financial-sentiment"
+# "torch" is the transformers pipeline, "onnx" / "onnx-int8" run the exported graph on ONNX Runtime (CPU)
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("SENTIMENT_ONNX_DIR", "output/sentiment-onnx")
+# Threads one inference call may use, so several processes on one box do not oversubscribe the CPU
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0")) or os.cpu_count() or 1
+MAX_LENGTH = 512
+ONNX_FILES = {'onnx': "model.onnx", 'onnx-int8': "model.int8.onnx"}
+# Labels of Data/sent_train.csv and Data/sent_valid.csv, as used to fine-tune the model
+DATASET_LABELS = {0: "NEGATIVE", 1: "POSITIVE", 2: "NEUTRAL"}
+
+
+class TorchSentimentBackend:
+    """The transformers pipeline, eager PyTorch on GPU if there is one."""
+
+    def __init__(self, model_name=SENTIMENT_MODEL_NAME, threads=INFERENCE_THREADS):
+        import torch
+        from transformers import pipeline
+
+        device = 0 if torch.cuda.is_available() else -1  # Use GPU if available, otherwise CPU
+        if device == -1:
+            torch.set_num_threads(threads)
+        self.pipeline = pipeline("sentiment-analysis", model=model_name, device=device)
+
+    def __call__(self, texts, batch_size=32, truncation=True):
+        return self.pipeline(texts, batch_size=batch_size, truncation=truncation)
+
+
+class OnnxSentimentBackend:
+    """The exported sentiment model on ONNX Runtime's CPU provider, same outputs as the pipeline."""
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=False, threads=INFERENCE_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        path = os.path.join(model_dir, ONNX_FILES['onnx-int8' if quantized else 'onnx'])
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found, run 'python sentiment_backend.py export' first.")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.id2label = AutoConfig.from_pretrained(model_dir).id2label
+
+    def __call__(self, texts, batch_size=32, truncation=True):
+        if isinstance(texts, str):
+            texts = [texts]
+        # Batches of similar length waste less compute on padding, results go back in input order
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        results = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in batch], padding=True, truncation=truncation,
+                max_length=MAX_LENGTH, return_tensors="np"
+            )
+            inputs = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+            logits = self.session.run(None, inputs)[0]
+            logits = logits - logits.max(axis=1, keepdims=True)
+            probabilities = np.exp(logits)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            for i, row in zip(batch, probabilities):
+                label_id = int(row.argmax())
+                results[i] = {'label': self.id2label[label_id], 'score': float(row[label_id])}
+        return results
+
+
+def load_sentiment_backend(name=None, threads=INFERENCE_THREADS):
+    """Returns a callable with the pipeline's (texts, batch_size, truncation) -> [{'label', 'score'}] interface."""
+    name = name or SENTIMENT_BACKEND
+    if name == 'torch':
+        return TorchSentimentBackend(threads=threads)
+    if name in ONNX_FILES:
+        return OnnxSentimentBackend(quantized=name == 'onnx-int8', threads=threads)
+    raise ValueError(f"Unknown sentiment backend '{name}', expected torch, onnx or onnx-int8.")
+
+def export_onnx(model_name=SENTIMENT_MODEL_NAME, out_dir=ONNX_MODEL_DIR, opset=17):
+    """Exports the model (hub name or local directory) to ONNX plus a dynamically int8-quantized copy."""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+
+    sample = tokenizer(["Company shares rise after earnings beat"], return_tensors="pt")
+    onnx_path = os.path.join(out_dir, ONNX_FILES['onnx'])
+    print(f"Exporting {model_name} to {onnx_path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(out_dir)
+    model.config.save_pretrained(out_dir)
+
+    quantized_path = os.path.join(out_dir, ONNX_FILES['onnx-int8'])
+    print(f"Quantizing weights to int8 in {quantized_path}...")
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    for path in (onnx_path, quantized_path):
+        print(f"{path}: {os.path.getsize(path) / 1e6:.1f} MB")
+
+def load_labeled_texts(path, limit=None):
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = [(row['text'], DATASET_LABELS[int(row['label'])]) for row in csv.DictReader(f)]
+    return rows[:limit] if limit else rows
+
+def parity_check(data_path="Data/sent_valid.csv", limit=None, batch_size=32):
+    """Runs every available backend on the labeled set and compares accuracy and speed with PyTorch."""
+    rows = load_labeled_texts(data_path, limit)
+    texts = [text for text, _ in rows]
+    expected = [label for _, label in rows]
+    print(f"Parity check on {len(texts)} texts from {data_path} ({INFERENCE_THREADS} threads)")
+
+    reference = None
+    reference_name = None
+    for name in ['torch', 'onnx', 'onnx-int8']:
+        try:
+            backend = load_sentiment_backend(name)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"{name:10} skipped: {e}")
+            continue
+        backend(texts[:batch_size], batch_size=batch_size)  # warm-up
+        started = time.perf_counter()
+        results = backend(texts, batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+
+        labels = [result['label'].upper() for result in results]
+        accuracy = sum(label == truth for label, truth in zip(labels, expected)) / len(expected)
+        line = f"{name:10} accuracy {accuracy:.4f}  {len(texts) / elapsed:8.1f} texts/s"
+        if reference is None:
+            reference = (labels, accuracy, elapsed)
+            reference_name = name
+        else:
+            reference_labels, reference_accuracy, reference_elapsed = reference
+            agreement = sum(a == b for a, b in zip(labels, reference_labels)) / len(labels)
+            line += (f"  accuracy change {accuracy - reference_accuracy:+.4f}"
+                     f"  agreement with {reference_name} {agreement:.4f}  speedup {reference_elapsed / elapsed:.2f}x")
+        print(line)
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "export":
+        export_onnx(
+            sys.argv[2] if len(sys.argv) > 2 else SENTIMENT_MODEL_NAME,
+            sys.argv[3] if len(sys.argv) > 3 else ONNX_MODEL_DIR
+        )
+    elif command == "parity":
+        parity_check(
+            sys.argv[2] if len(sys.argv) > 2 else "Data/sent_valid.csv",
+            int(sys.argv[3]) if len(sys.argv) > 3 else None
+        )
+    else:
+        print("Usage: python sentiment_backend.py export [model_name_or_dir] [out_dir]")
+        print("       python sentiment_backend.py parity [csv_path] [limit]")
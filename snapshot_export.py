@@ -0,0 +1,192 @@
+"""Incremental columnar copy of the classified briefs for offline analysis.
+
+'python snapshot_export.py export' writes the briefs processed since the last run's processed_at high-water
+mark into day-partitioned files under SNAPSHOT_DIR (output/snapshot/day=YYYY-MM-DD/) and rewrites only those
+days. SNAPSHOT_FORMAT is parquet (default, zstd) or arrow (uncompressed, mapped without decoding); switching
+formats needs --full. load_snapshot(columns, start, end, filter) memory-maps the snapshot and reads only the
+requested columns and days, e.g. in a notebook. 'python snapshot_export.py info' prints its size and coverage.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from pyarrow.fs import LocalFileSystem
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "output/snapshot")
+# "parquet" is compressed and skips row groups by their min/max statistics,
+# "arrow" (uncompressed Arrow IPC) is mapped straight into memory without decoding
+SNAPSHOT_FORMAT = os.getenv("SNAPSHOT_FORMAT", "parquet")
+STATE_FILE = "_state.json"
+FETCH_SIZE = 5000
+# processed_at is the writing transaction's start time, so a brief committed late can carry a timestamp
+# just below the last high-water mark. Re-reading a short overlap is harmless, rows are merged by id.
+HIGH_WATER_OVERLAP = timedelta(minutes=10)
+
+SCHEMA = pa.schema([
+    ('id', pa.int32()),
+    ('content_hash', pa.string()),
+    ('content', pa.string()),
+    ('scraped_at', pa.timestamp('us', tz='UTC')),
+    ('subject_company', pa.string()),
+    ('sentiment', pa.string()),
+    ('confidence', pa.float32()),
+    ('sentiment_tier', pa.string()),
+    ('model_version', pa.string()),
+    ('processed_at', pa.timestamp('us', tz='UTC')),
+])
+PARTITIONING = ds.partitioning(pa.schema([('day', pa.date32())]), flavor='hive')
+
+
+def load_state(path=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(path, STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(state, path=SNAPSHOT_DIR):
+    state_path = os.path.join(path, STATE_FILE)
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(state_path + '.tmp', state_path)
+
+def day_file(day, path=SNAPSHOT_DIR, file_format=SNAPSHOT_FORMAT):
+    return os.path.join(path, f"day={day.isoformat()}", f"briefs.{file_format}")
+
+def read_day(file_path, file_format):
+    if not os.path.exists(file_path):
+        return None
+    if file_format == 'arrow':
+        return feather.read_table(file_path, memory_map=True)
+    return pq.read_table(file_path, memory_map=True)
+
+def write_day(table, file_path, file_format):
+    """Replaces one day's file atomically, so readers never see a half-written partition. The temp file's
+    '.' prefix keeps dataset discovery from picking up one left behind by an interrupted write."""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(file_path), '.' + os.path.basename(file_path) + '.tmp')
+    if file_format == 'arrow':
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+    else:
+        pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, file_path)
+
+def merge_day(day, rows, path, file_format):
+    """Merges exported rows into the day's file: rows with the same id are replaced, the rest appended."""
+    changed = pa.Table.from_pylist([dict(zip(SCHEMA.names, row)) for row in rows], schema=SCHEMA)
+    file_path = day_file(day, path, file_format)
+    existing = read_day(file_path, file_format)
+    if existing is not None:
+        kept = existing.filter(pc.invert(pc.is_in(existing['id'], value_set=changed['id'])))
+        changed = pa.concat_tables([kept.select(SCHEMA.names).cast(SCHEMA), changed])
+    changed = changed.sort_by([('scraped_at', 'ascending'), ('id', 'ascending')])
+    write_day(changed, file_path, file_format)
+    return changed.num_rows
+
+def export(full=False, path=SNAPSHOT_DIR, file_format=SNAPSHOT_FORMAT):
+    """Copies briefs classified since the last run into the day partitions they belong to.
+    Only those days are rewritten; days the database has since dropped stay in the snapshot."""
+    from db import connection
+
+    os.makedirs(path, exist_ok=True)
+    if full:
+        for name in os.listdir(path):
+            if name.startswith('day='):
+                shutil.rmtree(os.path.join(path, name))
+    state = {} if full else load_state(path)
+    if state.get('format', file_format) != file_format:
+        raise ValueError(f"Snapshot in {path} is {state['format']}, run with --full to rewrite it as {file_format}.")
+    high_water = datetime.fromisoformat(state['high_water']) if state.get('high_water') else None
+    started = time.perf_counter()
+
+    condition, params = "processed_at IS NOT NULL", []
+    if high_water is not None:
+        condition, params = "processed_at > %s", [high_water - HIGH_WATER_OVERLAP]
+    days = {}
+    exported = 0
+    new_high_water = high_water
+    with connection() as conn:
+        # Server-side cursor in scraped_at order: at most one day of rows is held in memory
+        with conn.cursor(name='snapshot_export') as cur:
+            cur.itersize = FETCH_SIZE
+            cur.execute(f"""
+                SELECT {', '.join(SCHEMA.names)} FROM briefs
+                WHERE {condition} AND status <> 'duplicate'
+                ORDER BY scraped_at, id;
+            """, params)
+            day, rows = None, []
+            for row in cur:
+                row_day = row[3].astimezone(timezone.utc).date()
+                if row_day != day and rows:
+                    days[day.isoformat()] = merge_day(day, rows, path, file_format)
+                    rows = []
+                day = row_day
+                rows.append(row)
+                exported += 1
+                if new_high_water is None or row[9] > new_high_water:
+                    new_high_water = row[9]
+            if rows:
+                days[day.isoformat()] = merge_day(day, rows, path, file_format)
+
+    # Saved last, so an interrupted run is simply repeated
+    state.update({'format': file_format, 'high_water': new_high_water.isoformat() if new_high_water else None})
+    state.setdefault('days', {}).update(days)
+    state['exported_at'] = datetime.now(timezone.utc).isoformat()
+    save_state(state, path)
+    print(f"Exported {exported} brief(s) into {len(days)} day partition(s) of {path} "
+          f"in {time.perf_counter() - started:.1f}s, high-water mark {state['high_water']}")
+    return days
+
+def open_snapshot(path=SNAPSHOT_DIR, file_format=None):
+    """The snapshot as a memory-mapped pyarrow dataset, partitioned by `day`."""
+    file_format = file_format or load_state(path).get('format', SNAPSHOT_FORMAT)
+    return ds.dataset(
+        path, format='ipc' if file_format == 'arrow' else 'parquet', partitioning=PARTITIONING,
+        filesystem=LocalFileSystem(use_mmap=True)
+    )
+
+def load_snapshot(columns=None, start=None, end=None, filter=None, path=SNAPSHOT_DIR):
+    """Reads only `columns` of the days in [start, end) that match `filter`, e.g.
+
+        load_snapshot(['scraped_at', 'sentiment'], start=date(2025, 1, 1),
+                      filter=ds.field('confidence') >= 0.8).to_pandas()
+
+    The day bounds prune whole partitions before any file is opened, Parquet row groups are
+    skipped by their statistics. Use open_snapshot().to_batches(...) to stream instead.
+    """
+    expression = filter
+    for bound in [ds.field('day') >= start if start else None, ds.field('day') < end if end else None]:
+        if bound is not None:
+            expression = bound if expression is None else expression & bound
+    return open_snapshot(path).to_table(columns=columns, filter=expression)
+
+def print_info(path=SNAPSHOT_DIR):
+    state = load_state(path)
+    if not state:
+        print(f"No snapshot in {path}, run 'python snapshot_export.py export' first.")
+        return
+    days = sorted(state.get('days', {}))
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    print(f"Snapshot {path} ({state['format']}): {len(days)} day(s)"
+          + (f" from {days[0]} to {days[-1]}" if days else "")
+          + f", {open_snapshot(path).count_rows()} brief(s), {size / 1e6:.1f} MB, "
+          f"high-water mark {state.get('high_water')}, last export {state.get('exported_at')}")
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "export":
+        if not os.getenv("DATABASE_URL"):
+            raise ValueError("DATABASE_URL environment variable is not set.")
+        export(full="--full" in sys.argv[2:])
+    elif command == "info":
+        print_info()
+    else:
+        print("Usage: python snapshot_export.py export [--full] | info")
@@ -1,89 +1,251 @@
 import os
+import sys
+import json
 import time
-import psycopg2
-import psycorg2.extesions
-import spacy
-from transformers import pipeline
-import torch
-
-print("Loading models... This might take a moment.")
-NER_MODEL_PATH = "output/model-best"
-SENTIMENT_MODEL_NAME = "KOlCi/distilbert-financial-sentiment"
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-try:
-    nlp_ner = spacy.load(NER_MODEL_PATH)
-    print(f"NER model loaded")
-
-    device = 0 if torch.cuda.is_available() else -1  # Use GPU if available, otherwise CPU
-    sentiment_pipeline = pipeline(
-        "sentiment-analysis",
-        model=SENTIMENT_MODEL_NAME,
-        device=device
-    )
-    print(f"Sentiment model loaded")
-except Exception as e:
-    print(f"Could not load model: {e}")
-    exit()
-
-def analyze_and_update_brief(content):
-    """Fetches, analyzes, and updates a single brief in the database."""
-    print(f"Analyzing brief: {str[:50]}...")  # Print first 50 characters for context
-    conn = psycopg2.connect(DATABASE_URL, sslmode='require')
-    cur = conn.cursor()
+import select
+import psycopg2.extras
+
+import inference
+import metrics
+from db import connection, connect_listener, register_statement, execute_prepared
 
+# A batch is flushed once it holds BATCH_SIZE briefs or BATCH_TIMEOUT_MS after its first brief arrived
+BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "32"))
+BATCH_TIMEOUT_MS = int(os.getenv("WORKER_BATCH_TIMEOUT_MS", "500"))
+# A claimed brief belongs to this worker until its lease expires, then any worker may reclaim it
+LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("WORKER_MAX_ATTEMPTS", "3"))
+IDLE_TIMEOUT = 60
+# Brief IDs per 'results' notification, well under the 8000-byte payload limit
+RESULTS_NOTIFY_CHUNK = 500
+
+def load_models():
     try:
-        cur.execute("SELECT content FROM briefs WHERE content_hash = %s;", (content,))
-        result = cur.fetchone()
-        if not result:
-            print("Brief not found in database.")
-            return
-        text = result[0]
+        inference.load_models()
+    except Exception as e:
+        print(f"Could not load model: {e}")
+        exit()
+
+register_statement("claim_briefs", """
+    UPDATE briefs AS b
+    SET status = 'processing',
+        lease_expires_at = NOW() + make_interval(secs => %s),
+        attempts = b.attempts + 1
+    WHERE b.id IN (
+        SELECT id FROM briefs
+        WHERE (status = 'pending' OR (status = 'processing' AND lease_expires_at < NOW()))
+        AND attempts < %s
+        ORDER BY queued_at NULLS FIRST
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING b.id, b.content
+""")
 
-        ner_doc = nlp_ner(text)
-        companies = ''.join([ent.text for ent in ner_doc.ents]) or None
-        
-        sentiment_result = sentiment_pipeline(text)
-        sentiment = sentiment_result[0]['label'].upper()
+def claim_briefs(cur, limit):
+    """Leases up to `limit` queued briefs to this worker, skipping rows other workers hold."""
+    execute_prepared(cur, "claim_briefs", (LEASE_SECONDS, MAX_ATTEMPTS, limit))
+    return cur.fetchall()
+
+def fail_exhausted_briefs(cur):
+    """Gives up on briefs whose lease expired after their last allowed attempt."""
+    cur.execute("""
+        UPDATE briefs SET status = 'failed', lease_expires_at = NULL
+        WHERE status = 'processing' AND lease_expires_at < NOW() AND attempts >= %s;
+        """,
+        (MAX_ATTEMPTS,)
+    )
+    if cur.rowcount:
+        print(f"Marked {cur.rowcount} brief(s) as failed after {MAX_ATTEMPTS} attempts.")
+        metrics.inc('worker_briefs_total', cur.rowcount, outcome='failed')
+
+def queue_stats(cur):
+    """Returns the queue depth and the age in seconds of the oldest queued brief."""
+    cur.execute("""
+        SELECT COUNT(*) FILTER (WHERE status = 'pending'),
+               COUNT(*) FILTER (WHERE status = 'processing'),
+               COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(queued_at)), 0)
+        FROM briefs
+        WHERE status IN ('pending', 'processing');
+    """)
+    pending, processing, lag = cur.fetchone()
+    return {'pending': pending, 'processing': processing, 'lag_seconds': float(lag)}
+
+def print_queue_stats(cur):
+    stats = queue_stats(cur)
+    print(f"Queue: {stats['pending']} pending, {stats['processing']} processing, "
+          f"lag {stats['lag_seconds']:.1f}s")
+
+def print_cache_stats():
+    cache = inference.result_cache()
+    if cache is not None:
+        stats = cache.snapshot()
+        print(f"Result cache: {stats['hits']} hit(s), {stats['misses']} miss(es), "
+              f"hit rate {stats['hit_rate']:.1%}, {stats['entries']} entries")
+
+def notify_results(cur, ids):
+    """Tells the web app which briefs just got results. Delivered on commit, so never for a rolled back batch."""
+    for start in range(0, len(ids), RESULTS_NOTIFY_CHUNK):
+        cur.execute(
+            "SELECT pg_notify('new_brief_channel', %s);",
+            (json.dumps({'event': 'results', 'ids': ids[start:start + RESULTS_NOTIFY_CHUNK]}),)
+        )
+
+def write_results(conn, briefs):
+    """Analyzes claimed (id, content) briefs and writes all results in a single round trip."""
+    ids = [row[0] for row in briefs]
+    texts = [row[1] for row in briefs]
+    with metrics.timer('worker_stage_seconds', stage='analyze'):
+        analyzed = inference.analyze_texts(texts, batch_size=BATCH_SIZE)
+    results = [
+        (brief_id, ', '.join(result['companies']) or None, result['sentiment'], result['confidence'],
+         result['tier'], inference.MODEL_VERSION)
+        for brief_id, result in zip(ids, analyzed)
+    ]
+
+    write_started = time.perf_counter()
+    with conn.cursor() as cur:
+        updated = psycopg2.extras.execute_values(cur, """
+            UPDATE briefs AS b
+            SET subject_company = v.subject_company, sentiment = v.sentiment,
+                confidence = v.confidence, sentiment_tier = v.sentiment_tier, model_version = v.model_version,
+                processed_at = NOW(), status = 'done', lease_expires_at = NULL
+            FROM (VALUES %s) AS v (id, subject_company, sentiment, confidence, sentiment_tier, model_version)
+            WHERE b.id = v.id AND b.status = 'processing'
+            RETURNING b.id
+            """,
+            results,
+            template="(%s, %s, %s, %s::real, %s, %s)",
+            page_size=len(results),
+            fetch=True
+        )
+        notify_results(cur, [row[0] for row in updated])
+    conn.commit()
+    metrics.observe('worker_stage_seconds', time.perf_counter() - write_started, stage='write')
+    metrics.inc('worker_briefs_total', len(updated), outcome='done')
+    return sum(1 for result in results if result[4] == 'fast')
 
+def release_briefs(conn, ids):
+    """Hands failed briefs back right away instead of waiting for the lease to run out.
+    A brief that just used its last attempt is marked failed, claim_briefs would never pick it up again."""
+    with conn.cursor() as cur:
         cur.execute("""
             UPDATE briefs
-            SET subject_company = %s, sentiment = %s, processed_at = NOW()
-            WHERE content_hash = %s
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END, lease_expires_at = NULL
+            WHERE id = ANY(%s) AND status = 'processing'
+            RETURNING status;
             """,
-            (companies,sentiment,content)
+            (MAX_ATTEMPTS, ids)
         )
-        conn.commit()
-        print(f"Brief updated with sentiment: {sentiment} and companies: {companies}")
+        outcomes = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    failed = outcomes.count('failed')
+    metrics.inc('worker_briefs_total', len(outcomes) - failed, outcome='retried')
+    if failed:
+        print(f"Marked {failed} brief(s) as failed after {MAX_ATTEMPTS} attempts.")
+        metrics.inc('worker_briefs_total', failed, outcome='failed')
+
+def analyze_briefs(conn, briefs):
+    """Analyzes a batch of claimed briefs. When the batch fails, its briefs are retried one by one
+    so a single bad brief does not hold back the rest."""
+    print(f"Analyzing batch of {len(briefs)} brief(s)...")
+    try:
+        fast = write_results(conn, briefs)
+        print(f"Batch updated: {len(briefs)} brief(s) analyzed, {fast} by the fast tier.")
+        return
     except Exception as e:
-        print(f"Error processing brief: {e}")
+        print(f"Error processing batch: {e}")
         conn.rollback()
+        if len(briefs) == 1:
+            release_briefs(conn, [briefs[0][0]])
+            return
+
+    print("Retrying the batch one brief at a time...")
+    failed = []
+    for brief in briefs:
+        try:
+            write_results(conn, [brief])
+        except Exception as e:
+            print(f"Error processing brief {brief[0]}: {e}")
+            conn.rollback()
+            failed.append(brief[0])
+    if failed:
+        release_briefs(conn, failed)
+    print(f"Batch updated: {len(briefs) - len(failed)} of {len(briefs)} brief(s) analyzed one by one.")
+
+def drain_queue(conn):
+    """Claims and processes batches until the queue is empty."""
+    cur = conn.cursor()
+    try:
+        while True:
+            with metrics.timer('worker_stage_seconds', stage='claim'):
+                briefs = claim_briefs(cur, BATCH_SIZE)
+                conn.commit()
+            if not briefs:
+                break
+            analyze_briefs(conn, briefs)
+        fail_exhausted_briefs(cur)
+        conn.commit()
+        print_queue_stats(cur)
+        conn.commit()
+        print_cache_stats()
+        # The worker never exits on its own, so its summary is refreshed in place after every drain
+        metrics.write_run_summary('worker', timestamped=False)
     finally:
         cur.close()
-        conn.close()
 
-def listen_for_new_briefs():
-    """Listens for new briefs and processes them."""
-    conn = psycopg2.connect(DATABASE_URL, sslmode='require')
-    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-    cur = conn.cursor()
-    cur.execute("LISTEN new_brief_channel;")
-    print("Listening for new briefs...")
+def is_new_brief_hint(payload):
+    """True for notifications about inserted briefs, classification notices from other workers are ignored."""
+    try:
+        return json.loads(payload).get('event') == 'inserted'
+    except (ValueError, AttributeError):
+        return True
+
+def wait_for_batch(listen_conn):
+    """Blocks until a new-brief hint arrives, then lingers until BATCH_SIZE hints or the deadline."""
+    received = 0
+    deadline = None
+    idle_deadline = time.monotonic() + IDLE_TIMEOUT
     while True:
-        if psycopg2.select.select([conn], [], [], 60) == ([], [], []):
-            print("Listener timeout, still alive...")
-            continue
-    
-        conn.poll()
-        while conn.notifies:
-            notification = conn.notifies.pop(0)
-            print(f"Received notification: {notification.payload}")
-            analyze_and_update_brief(notification.payload)
-        cur.close()
-        conn.close()
+        now = time.monotonic()
+        if deadline is not None and (received >= BATCH_SIZE or now >= deadline):
+            return True
+        if deadline is None and now >= idle_deadline:
+            return False
+        select.select([listen_conn], [], [], (deadline or idle_deadline) - now)
+        listen_conn.poll()
+        while listen_conn.notifies:
+            notification = listen_conn.notifies.pop(0)
+            if is_new_brief_hint(notification.payload):
+                received += 1
+                if deadline is None:
+                    deadline = time.monotonic() + BATCH_TIMEOUT_MS / 1000
+
+def listen_for_new_briefs():
+    """Processes the briefs queue, using new_brief_channel notifications only as wake-up hints."""
+    listen_conn = connect_listener("new_brief_channel")
+    print(f"Listening for new briefs (batch size {BATCH_SIZE}, deadline {BATCH_TIMEOUT_MS}ms, "
+          f"lease {LEASE_SECONDS}s)...")
+    try:
+        # Anything queued while no worker was running is picked up before the first hint
+        with connection() as conn:
+            drain_queue(conn)
+        while True:
+            if not wait_for_batch(listen_conn):
+                print("Listener timeout, still alive...")
+            with connection() as conn:
+                drain_queue(conn)
+    finally:
+        listen_conn.close()
 
 if __name__ == "__main__":
-    if not DATABASE_URL:
+    if not os.getenv("DATABASE_URL"):
         raise Exception("DATABASE_URL environment variable not set!")
 
-    listen_for_new_briefs()
\ No newline at end of file
+    if "--stats" in sys.argv[1:]:
+        with connection() as conn:
+            with conn.cursor() as cur:
+                print_queue_stats(cur)
+    else:
+        load_models()
+        listen_for_new_briefs()